@@ -1,130 +1,205 @@
 from __future__ import annotations
 
+import csv
 import os
 import re
 import sqlite3
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional, Sequence
+from typing import Sequence
 
+import numpy as np
 import pandas as pd
 
+try:  # optional: Arrow string kernels release the GIL, so columns normalize in parallel
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    pa = None
+
 
 # -------------------------
 # Shared helpers
 # -------------------------
-def norm(s: Optional[str]) -> str:
-    if s is None:
-        return ""
-    s = str(s).strip().upper()
-    s = re.sub(r"\s+", " ", s)
-    return s
+_WS = re.compile(r"\s+")
 
 
-def split_df_route(df_route: str) -> tuple[str, str]:
-    # Orange Book combined field like: 'TABLET;ORAL'
-    if not df_route:
-        return "", ""
-    parts = [p.strip() for p in df_route.split(";", 1)]
-    if len(parts) == 1:
-        return parts[0], ""
-    return parts[0], parts[1]
+def tune_for_bulk_load(con: sqlite3.Connection) -> None:
+    # Rebuildable artifacts: trade durability for ingest speed
+    con.execute("PRAGMA journal_mode=WAL;")
+    con.execute("PRAGMA synchronous=OFF;")
+    con.execute("PRAGMA temp_store=MEMORY;")
+    con.execute("PRAGMA cache_size=-262144;")
+
+
+def finish_bulk_load(con: sqlite3.Connection) -> None:
+    # Fold the WAL back in so the shipped .db is a single self-contained file
+    con.commit()
+    con.execute("PRAGMA journal_mode=DELETE;")
+    con.close()
+
+
+def insert_frame(cur: sqlite3.Cursor, table: str, df: pd.DataFrame) -> None:
+    # One executemany over a lazy tuple stream: skips pandas' SQL layer and its
+    # per-call commit, so the caller's single transaction stays intact
+    placeholders = ",".join("?" * len(df.columns))
+    cur.executemany(
+        f"INSERT INTO {table} VALUES ({placeholders})",
+        df.itertuples(index=False, name=None)
+    )
+
+
+# RE2 equivalent of Python's str-mode \s (RE2's \s is ASCII-only)
+_WS_RE2 = r"[\s\x0b\x1c-\x1f\x85\p{Z}]+"
+
+
+def vnorm(s: pd.Series) -> pd.Series:
+    # Uppercase, collapse whitespace runs to one space and trim, for a whole column
+    if pa is None:
+        return s.str.upper().str.replace(_WS, " ", regex=True).str.strip()
+    arr = pc.utf8_upper(pa.array(s, type=pa.string()))
+    arr = pc.replace_substring_regex(arr, _WS_RE2, " ")
+    arr = pc.utf8_trim_whitespace(arr)
+    return pd.Series(arr.to_numpy(zero_copy_only=False), index=s.index, name=s.name)
+
+
+def vnorm_columns(df: pd.DataFrame, cols: Sequence[str]) -> None:
+    # Add <col>_n for each column; with pyarrow the columns run on separate cores
+    if pa is None:
+        for c in cols:
+            df[f"{c}_n"] = vnorm(df[c])
+        return
+    pa.set_cpu_count(os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=min(len(cols), os.cpu_count() or 1)) as pool:
+        for c, normed in zip(cols, pool.map(vnorm, [df[c] for c in cols])):
+            df[f"{c}_n"] = normed
 
 
 # -------------------------
 # Orange Book -> products.db
 # -------------------------
+# Columns with only a handful of distinct values, dictionary-encoded on disk
+OB_DIM_COLUMNS = ("appl_type", "dosage_form", "route", "te_code", "product_type")
+
+
 def build_ob(products_txt_path: str, products_db_path: str) -> None:
     os.makedirs(os.path.dirname(products_db_path), exist_ok=True)
+
+    # Orange Book is '~' delimited; quotes inside trade names are literal
+    df = pd.read_csv(products_txt_path, sep="~", encoding="latin-1", dtype=str,
+                     keep_default_na=False, quoting=csv.QUOTE_NONE)
+
+    required = ["Ingredient", "DF;Route", "Trade_Name", "Strength", "Appl_Type", "Appl_No", "Product_No", "TE_Code"]
+    missing = [c for c in required if c not in df.columns]
+    if missing:
+        raise ValueError(f"Missing expected Orange Book columns: {missing}\nFound: {list(df.columns)}")
+
+    for c in ("RLD", "RS", "Type"):
+        if c not in df.columns:
+            df[c] = ""
+    df = df.fillna("")
+
+    # Orange Book combined field like: 'TABLET;ORAL'
+    df_route = df["DF;Route"].str.split(";", n=1, expand=True).reindex(columns=[0, 1]).fillna("")
+
+    out = pd.DataFrame({
+        "appl_type": df["Appl_Type"],
+        "appl_no": df["Appl_No"],
+        "product_no": df["Product_No"],
+        "trade_name": df["Trade_Name"],
+        "ingredient": df["Ingredient"],
+        "strength": df["Strength"],
+        "dosage_form": df_route[0],
+        "route": df_route[1],
+        "te_code": df["TE_Code"],
+        "rld": df["RLD"],
+        "rs": df["RS"],
+        "product_type": df["Type"],
+    }).apply(lambda col: col.str.strip())
+
+    vnorm_columns(out, ["trade_name", "ingredient", "strength", "dosage_form", "route", "te_code"])
+
+    # Low-cardinality text columns are stored as small integer codes into
+    # dim_<column>(id, value) tables; sort=True keeps ids stable across rebuilds.
+    dims = {}
+    for c in OB_DIM_COLUMNS:
+        codes, values = pd.factorize(out[c], sort=True)
+        out[c] = codes
+        dims[c] = values
+
     con = sqlite3.connect(products_db_path)
+    tune_for_bulk_load(con)
     cur = con.cursor()
 
-    cur.execute("DROP TABLE IF EXISTS ob_products_slim;")
+    # ob_products_slim used to be a table; it is now a view over ob_products
+    cur.execute("SELECT type FROM sqlite_master WHERE name = 'ob_products_slim';")
+    existing = cur.fetchone()
+    if existing:
+        cur.execute(f"DROP {existing[0].upper()} ob_products_slim;")
+    cur.execute("DROP TABLE IF EXISTS ob_fts;")
+    cur.execute("DROP TABLE IF EXISTS ob_products_fts;")
+    cur.execute("DROP TABLE IF EXISTS ob_products;")
+
+    for c, values in dims.items():
+        cur.execute(f"DROP TABLE IF EXISTS dim_{c};")
+        cur.execute(f"CREATE TABLE dim_{c} (id INTEGER PRIMARY KEY, value TEXT UNIQUE);")
+        cur.executemany(f"INSERT INTO dim_{c} VALUES (?,?)", enumerate(values))
+
     cur.execute("""
-        CREATE TABLE ob_products_slim (
-            appl_type TEXT,
+        CREATE TABLE ob_products (
+            appl_type INTEGER REFERENCES dim_appl_type(id),
             appl_no TEXT,
             product_no TEXT,
             trade_name TEXT,
             ingredient TEXT,
             strength TEXT,
-            dosage_form TEXT,
-            route TEXT,
-            te_code TEXT,
+            dosage_form INTEGER REFERENCES dim_dosage_form(id),
+            route INTEGER REFERENCES dim_route(id),
+            te_code INTEGER REFERENCES dim_te_code(id),
             rld TEXT,
             rs TEXT,
-            product_type TEXT,
+            product_type INTEGER REFERENCES dim_product_type(id),
 
             trade_name_n TEXT,
             ingredient_n TEXT,
             strength_n TEXT,
             dosage_form_n TEXT,
             route_n TEXT,
-            te_code_n TEXT
+            te_code_n TEXT,
+
+            id INTEGER PRIMARY KEY
         );
     """)
 
-    with open(products_txt_path, "r", encoding="latin-1", errors="replace") as f:
-        header = f.readline().rstrip("\n")
-        cols = header.split("~")
-        idx = {c: i for i, c in enumerate(cols)}
-
-        required = ["Ingredient", "DF;Route", "Trade_Name", "Strength", "Appl_Type", "Appl_No", "Product_No", "TE_Code"]
-        missing = [c for c in required if c not in idx]
-        if missing:
-            raise ValueError(f"Missing expected Orange Book columns: {missing}\nFound: {cols}")
-
-        opt = {"RLD": idx.get("RLD"), "RS": idx.get("RS"), "Type": idx.get("Type")}
-
-        batch = []
-        BATCH = 50_000
-
-        for line in f:
-            parts = line.rstrip("\n").split("~")
-
-            ingredient = parts[idx["Ingredient"]].strip()
-            df_route = parts[idx["DF;Route"]].strip()
-            trade_name = parts[idx["Trade_Name"]].strip()
-            strength = parts[idx["Strength"]].strip()
-            appl_type = parts[idx["Appl_Type"]].strip()
-            appl_no = parts[idx["Appl_No"]].strip()
-            product_no = parts[idx["Product_No"]].strip()
-            te_code = parts[idx["TE_Code"]].strip()
-
-            dosage_form, route = split_df_route(df_route)
-
-            rld = parts[opt["RLD"]].strip() if opt["RLD"] is not None and opt["RLD"] < len(parts) else ""
-            rs = parts[opt["RS"]].strip() if opt["RS"] is not None and opt["RS"] < len(parts) else ""
-            product_type = parts[opt["Type"]].strip() if opt["Type"] is not None and opt["Type"] < len(parts) else ""
-
-            batch.append((
-                appl_type, appl_no, product_no,
-                trade_name, ingredient, strength,
-                dosage_form, route, te_code,
-                rld, rs, product_type,
-                norm(trade_name), norm(ingredient), norm(strength),
-                norm(dosage_form), norm(route), norm(te_code),
-            ))
-
-            if len(batch) >= BATCH:
-                cur.executemany(
-                    "INSERT INTO ob_products_slim VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)",
-                    batch
-                )
-                con.commit()
-                batch = []
-
-        if batch:
-            cur.executemany(
-                "INSERT INTO ob_products_slim VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)",
-                batch
-            )
-            con.commit()
-
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_ob_trade_name_n ON ob_products_slim(trade_name_n);")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_ob_equiv_key ON ob_products_slim(ingredient_n, strength_n, dosage_form_n, route_n);")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_ob_app ON ob_products_slim(appl_type, appl_no, product_no);")
-    con.commit()
-    con.close()
+    out["id"] = range(1, len(out) + 1)
+    insert_frame(cur, "ob_products", out)
+
+    # Same columns (in the same order) as the old ob_products_slim table, so
+    # query code is unchanged; `id` is appended for joins against ob_products.
+    select_cols = [f"{c}.value AS {c}" if c in dims else f"p.{c}" for c in out.columns if c != "id"]
+    joins = [f"JOIN dim_{c} {c} ON {c}.id = p.{c}" for c in dims]
+    cur.execute(
+        "CREATE VIEW ob_products_slim AS SELECT "
+        + ", ".join(select_cols + ["p.id AS id"])
+        + " FROM ob_products p " + " ".join(joins) + ";"
+    )
+
+    # (trade_name_n, strength_n): ob_match_identity filters on the name and scores on strength
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_ob_trade_name_n ON ob_products(trade_name_n, strength_n);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_ob_equiv_key ON ob_products(ingredient_n, strength_n, dosage_form_n, route_n);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_ob_app ON ob_products(appl_type, appl_no, product_no);")
+
+    # Trigram index over names for ob_match_identity's ranked non-exact
+    # (substring / misspelled) lookups
+    cur.execute("""
+        CREATE VIRTUAL TABLE ob_products_fts USING fts5(
+            trade_name_n, ingredient_n,
+            content='ob_products', content_rowid='id',
+            tokenize='trigram'
+        );
+    """)
+    cur.execute("INSERT INTO ob_products_fts(ob_products_fts) VALUES ('rebuild');")
+    finish_bulk_load(con)
     print("✅ Built Orange Book DB:", products_db_path)
 
 
@@ -142,6 +217,7 @@ def build_cms_partd(partd_csv_path: str, medicare_db_path: str,
     """
     os.makedirs(os.path.dirname(medicare_db_path), exist_ok=True)
     con = sqlite3.connect(medicare_db_path)
+    tune_for_bulk_load(con)
     cur = con.cursor()
 
     cur.execute(f"DROP TABLE IF EXISTS {table_name};")
@@ -166,56 +242,48 @@ def build_cms_partd(partd_csv_path: str, medicare_db_path: str,
     outlier_cols = [f"Outlier_Flag_{y}" for y in years]
     usecols = base_cols + spend_cols + outlier_cols
 
+    out_cols = ["brand_name", "generic_name", "manufacturer", "tot_mftr",
+                "year", "avg_spend_per_dose", "outlier_flag",
+                "brand_name_n", "generic_name_n"]
+
     for chunk in pd.read_csv(partd_csv_path, usecols=usecols, chunksize=chunksize):
-        chunk["Tot_Mftr"] = pd.to_numeric(chunk["Tot_Mftr"], errors="coerce").fillna(0).astype(int)
-
-        out_rows = []
-        for y in years:
-            spend_col = f"Avg_Spnd_Per_Dsg_Unt_Wghtd_{y}"
-            out_col = f"Outlier_Flag_{y}"
-
-            tmp = chunk[["Brnd_Name", "Gnrc_Name", "Tot_Mftr", "Mftr_Name", spend_col, out_col]].copy()
-            tmp = tmp.rename(columns={
-                "Brnd_Name": "brand_name",
-                "Gnrc_Name": "generic_name",
-                "Tot_Mftr": "tot_mftr",
-                "Mftr_Name": "manufacturer",
-                spend_col: "avg_spend_per_dose",
-                out_col: "outlier_flag",
-            })
-
-            tmp["year"] = y
-            tmp["avg_spend_per_dose"] = pd.to_numeric(tmp["avg_spend_per_dose"], errors="coerce")
-            tmp["outlier_flag"] = pd.to_numeric(tmp["outlier_flag"], errors="coerce").fillna(0).astype(int)
-
-            tmp = tmp[tmp["avg_spend_per_dose"].notna()]
-
-            tmp["brand_name_n"] = tmp["brand_name"].map(norm)
-            tmp["generic_name_n"] = tmp["generic_name"].map(norm)
-
-            out_rows.extend(list(zip(
-                tmp["brand_name"].astype(str).where(tmp["brand_name"].notna(), "").tolist(),
-                tmp["generic_name"].astype(str).where(tmp["generic_name"].notna(), "").tolist(),
-                tmp["manufacturer"].astype(str).where(tmp["manufacturer"].notna(), "").tolist(),
-                tmp["tot_mftr"].tolist(),
-                tmp["year"].tolist(),
-                tmp["avg_spend_per_dose"].tolist(),
-                tmp["outlier_flag"].tolist(),
-                tmp["brand_name_n"].tolist(),
-                tmp["generic_name_n"].tolist(),
-            )))
-
-        cur.executemany(
-            f"INSERT INTO {table_name} VALUES (?,?,?,?,?,?,?,?,?)",
-            out_rows
-        )
-        con.commit()
-
-    cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{table_name}_brand_n_year ON {table_name}(brand_name_n, year);")
-    cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{table_name}_generic_n_year ON {table_name}(generic_name_n, year);")
+        chunk = chunk.rename(columns={
+            "Brnd_Name": "brand_name",
+            "Gnrc_Name": "generic_name",
+            "Tot_Mftr": "tot_mftr",
+            "Mftr_Name": "manufacturer",
+        })
+
+        # Per-drug columns are parsed/normalized once here, before the melt
+        # repeats every row once per year.
+        tot = pd.to_numeric(chunk["tot_mftr"], errors="coerce").to_numpy(np.float32)
+        chunk["tot_mftr"] = np.nan_to_num(tot, nan=0).astype(np.int32)
+        for c in ("brand_name", "generic_name", "manufacturer"):
+            chunk[c] = chunk[c].fillna("").astype(str)
+        vnorm_columns(chunk, ["brand_name", "generic_name"])
+
+        # Wide -> long in one reshape. Both melts stack value columns in `years`
+        # order, so spend and outlier rows line up positionally.
+        id_cols = ["brand_name", "generic_name", "manufacturer", "tot_mftr", "brand_name_n", "generic_name_n"]
+        long = chunk.melt(id_vars=id_cols, value_vars=spend_cols,
+                          var_name="spend_col", value_name="avg_spend_per_dose")
+        outliers = pd.to_numeric(chunk.melt(value_vars=outlier_cols)["value"], errors="coerce").to_numpy(np.float32)
+
+        long["year"] = long["spend_col"].str[-4:].astype(int)
+        long["avg_spend_per_dose"] = pd.to_numeric(long["avg_spend_per_dose"], errors="coerce")
+        long["outlier_flag"] = np.nan_to_num(outliers, nan=0).astype(np.int32)
+
+        long = long[long["avg_spend_per_dose"].notna()]
+
+        # No per-chunk commit: the whole ingest is one transaction
+        insert_frame(cur, table_name, long[out_cols])
+
+    # Trailing avg_spend_per_dose: medicare_lookup_costs reads each name's rows
+    # for a year already in cost order, with no sort step
+    cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{table_name}_brand_n_year ON {table_name}(brand_name_n, year, avg_spend_per_dose);")
+    cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{table_name}_generic_n_year ON {table_name}(generic_name_n, year, avg_spend_per_dose);")
     cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{table_name}_year_cost ON {table_name}(year, avg_spend_per_dose);")
-    con.commit()
-    con.close()
+    finish_bulk_load(con)
     print("✅ Built Medicare DB:", medicare_db_path)
 
 
@@ -223,7 +291,7 @@ def build_cms_partd(partd_csv_path: str, medicare_db_path: str,
 # Main using your repo path
 # -------------------------
 if __name__ == "__main__":
-    repo_root = Path(__file__).resolve().parents[1]
+    repo_root = Path(__file__).resolve().parent
     data_dir = repo_root / "Data"
 
     products_txt = data_dir / "products.txt"
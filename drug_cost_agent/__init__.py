@@ -1,5 +1,5 @@
 """Drug cost agent package exports."""
 
-from .agent import root_agent
+from .agent import app, root_agent
 
-__all__ = ["root_agent"]
+__all__ = ["app", "root_agent"]
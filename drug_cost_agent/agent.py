@@ -5,13 +5,16 @@ from pathlib import Path
 
 from dotenv import load_dotenv
 from google.adk.agents import Agent
+from google.adk.agents.context_cache_config import ContextCacheConfig
+from google.adk.apps import App
 
 from src.tools.tools_ob import ob_match_identity, ob_find_equivalents, ob_ingredient_to_generic_candidates
-from src.tools.tools_medicare import medicare_latest_year, medicare_lookup_costs
-from src.tools.memory_tools import (
-    remember_drug_query,
-    recall_drug_query,
-    get_recent_queries
+from src.tools.tools_medicare import medicare_latest_year, medicare_lookup_costs, batch_medicare_lookup_costs
+from src.tools.memory_tools import get_recent_queries
+from src.plugins.session_memory import (
+    inject_session_memory,
+    capture_drug_identity,
+    store_final_response,
 )
 
 # Load environment variables from .env file if it exists (optional)
@@ -20,46 +23,68 @@ env_path = Path(__file__).resolve().parents[1] / ".env"
 if env_path.exists():
     load_dotenv(env_path)
 
+# Kept as one constant so every request starts with the identical prefix,
+# which is what Gemini context caching (see `app` below) keys on.
+INSTRUCTION = (
+    "You are a tool-using agent.\n"
+    "Goal: user gives a drug (name, maybe strength). Identify if brand or generic, find TE-equivalent options, "
+    "then rank by lowest Medicare Part D avg spend per dosage unit.\n\n"
+
+    "Memory:\n"
+    "- Relevant past answers (from this session, and earlier lookups of the same drug) are added to the "
+    "conversation automatically, "
+    "and your final answer is saved automatically - no tool calls needed\n"
+    "- Use get_recent_queries() to see what the user has been researching\n\n"
+
+    "Workflow:\n"
+    "1) If that memory covers this drug, mention we've looked this up before\n"
+    "2) Call medicare_latest_year to know which year is available (use that year only).\n"
+    "3) Call ob_match_identity(drug_name, strength?) to get the best Orange Book identity.\n"
+    "4) Call ob_find_equivalents using the identity's ingredient/strength/dosage_form/route (TE A* only).\n"
+    "5) Look up costs for ALL equivalent trade_names in the same response: call "
+    "batch_medicare_lookup_costs(names=[...every trade_name...], year=latest_year) once, "
+    "or call medicare_lookup_costs for every trade_name in the same response (parallel tool calls). "
+    "Never look them up one per turn.\n"
+    "   - If no Medicare rows are found for a trade_name, YOU decide whether to try fallback:\n"
+    "     a) Call ob_ingredient_to_generic_candidates(ingredient) to get generic candidates, then\n"
+    "     b) Call batch_medicare_lookup_costs(names=[...all candidates...], year=latest_year) in one call.\n"
+    "6) Choose the lowest avg_spend_per_dose across candidates and explain clearly.\n\n"
+
+    "If the Orange Book match is uncertain or user didn't provide strength and there are multiple plausible matches, "
+    "ask for strength/dosage form.\n"
+    "Always disclose the year used (latest available) and that this metric is program-level and may not equal copay."
+)
+
 root_agent = Agent(
     name="drug_cost_agent",
     model="gemini-2.5-flash",
     description="Find equivalent drugs and rank by Medicare Part D avg spend per dosage unit (latest year available).",
-    instruction=(
-        "You are a tool-using agent.\n"
-        "Goal: user gives a drug (name, maybe strength). Identify if brand or generic, find TE-equivalent options, "
-        "then rank by lowest Medicare Part D avg spend per dosage unit.\n\n"
-
-        "NEW CAPABILITY - Memory:\n"
-        "- Use recall_drug_query() at the START of each query to check if we've looked up this drug before\n"
-        "- Use remember_drug_query() at the END to save findings for future reference\n"
-        "- Use get_recent_queries() to see what the user has been researching\n\n"
-
-        "Workflow:\n"
-        "1) Check memory: recall_drug_query(drug_name, strength) - if found, mention we've looked this up before\n"
-        "2) Call medicare_latest_year to know which year is available (use that year only).\n"
-        "3) Call ob_match_identity(drug_name, strength?) to get the best Orange Book identity.\n"
-        "4) Call ob_find_equivalents using the identity's ingredient/strength/dosage_form/route (TE A* only).\n"
-        "5) For each equivalent trade_name, call medicare_lookup_costs(trade_name, year=latest_year).\n"
-        "   - If no Medicare rows are found for a trade_name, YOU decide whether to try fallback:\n"
-        "     a) Call ob_ingredient_to_generic_candidates(ingredient) to get generic candidates, then\n"
-        "     b) Call medicare_lookup_costs(candidate, year=latest_year) for candidates.\n"
-        "6) Save to memory: remember_drug_query(drug_name, strength, summary_of_findings)\n"
-        "7) Choose the lowest avg_spend_per_dose across candidates and explain clearly.\n\n"
-
-        "If the Orange Book match is uncertain or user didn't provide strength and there are multiple plausible matches, "
-        "ask for strength/dosage form.\n"
-        "Always disclose the year used (latest available) and that this metric is program-level and may not equal copay."
-    ),
+    instruction=INSTRUCTION,
     tools=[
         # Original tools
         medicare_latest_year,
         medicare_lookup_costs,
+        batch_medicare_lookup_costs,
         ob_match_identity,
         ob_find_equivalents,
         ob_ingredient_to_generic_candidates,
-        # NEW: Memory tools
-        remember_drug_query,
-        recall_drug_query,
+        # Memory tools (recall/remember run as callbacks below)
         get_recent_queries
-    ]
+    ],
+    before_model_callback=inject_session_memory,
+    after_tool_callback=capture_drug_identity,
+    after_model_callback=store_final_response,
+)
+
+# `adk web` / `adk run` load `app` in preference to `root_agent`. The cache
+# config lets ADK create a Gemini cached-content entry for the static prefix
+# (instruction + tool declarations) and reuse it across invocations.
+app = App(
+    name="drug_cost_agent",
+    root_agent=root_agent,
+    context_cache_config=ContextCacheConfig(
+        cache_intervals=10,
+        ttl_seconds=3600,
+        min_tokens=1024,
+    ),
 )
@@ -5,14 +5,39 @@
 # Replace or expand this with a real ADK Agent/Runner object later if required.
 
 from pathlib import Path
-import json
+
+# orjson parses much faster than stdlib json; fall back if it isn't installed
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    import json
+    _loads = lambda b: json.loads(b.decode("utf-8"))
+
+# ijson (optional) streams just the fields we use instead of building the whole document
+try:
+    import ijson
+except ImportError:
+    ijson = None
 
 _here = Path(__file__).parent
 _tests_path = _here / "test_cases.json"
 
+
+def _stream_suite(path: Path) -> dict:
+    """Read top-level name/description and the test_cases list without a full parse."""
+    suite = {}
+    with path.open("rb") as fh:
+        for prefix, event, value in ijson.parse(fh):
+            if prefix in ("name", "description") and event == "string":
+                suite[prefix] = value
+    with path.open("rb") as fh:
+        suite["test_cases"] = list(ijson.items(fh, "test_cases.item"))
+    return suite
+
+
 if _tests_path.exists():
-    with _tests_path.open("r", encoding="utf-8") as fh:
-        test_suite = json.load(fh)
+    test_suite = _stream_suite(_tests_path) if ijson is not None else _loads(_tests_path.read_bytes())
 else:
     test_suite = {
         "name": "Generify Evaluation Set (placeholder)",
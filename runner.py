@@ -3,7 +3,9 @@ Generify Custom Runner with LoggingPlugin
 Author: 2 files by Claude.ai combined into one by Yifon, debugged with Claude.ai
 """
 
+import functools
 import logging
+import os
 
 # Configure logging FIRST - before any other imports
 # Configure logging - SILENCE noisy loggers
@@ -44,7 +46,6 @@ class TokenCounterPlugin(BasePlugin):
     """Simple token counter"""
     def __init__(self):
         super().__init__(name="token_counter")  # ✅ Add name parameter
-        print("🔢 TokenCounterPlugin initialized!")
 
     
     async def after_model_callback(
@@ -53,47 +54,42 @@ class TokenCounterPlugin(BasePlugin):
         callback_context: CallbackContext,
         llm_response: LlmResponse
     ) -> Optional[LlmResponse]:
-        print("🔢 TokenCounterPlugin.after_model_callback CALLED!")  # Debug
-
-        if llm_response.usage_metadata:
-            tokens = llm_response.usage_metadata.total_token_count or 0
-            print(f"🔢 Tokens used: {tokens}")  # Use print, not logger
-            logger.info(f"🔢 Tokens used: {tokens}")
+        # %-style args are only formatted if DEBUG is enabled; python -O drops it entirely
+        if __debug__ and llm_response.usage_metadata:
+            logger.debug("tokens=%d", llm_response.usage_metadata.total_token_count or 0)
         return None
 
-print("🚀 CUSTOM RUNNER.PY IS LOADING!")
+# Debug banners are opt-in: GENERIFY_DEBUG=1
+_DEBUG = bool(os.environ.get("GENERIFY_DEBUG"))
+
+if _DEBUG:
+    print("🚀 CUSTOM RUNNER.PY IS LOADING!")
 
+@functools.lru_cache(maxsize=1)
 def create_runner():
     """
     Create and configure the runner with plugins
-    This function is called by ADK web interface
+    This function is called by ADK web interface.
+    Memoized: repeat calls (reloads, eval loops) reuse the same runner.
     """
 
-    print("🔧 Creating custom runner with plugins...")   
+    logger.debug("Creating custom runner with plugins")
 
     # Create plugins FIRST (before using them!)
     logging_plugin = LoggingPlugin()
-    print(f"✅ LoggingPlugin created: {logging_plugin}")
-
     token_counter = TokenCounterPlugin()
-    print(f"✅ TokenCounterPlugin created: {token_counter}")
-
     token_tracker = TokenBudgetTracker(
         history_file="data/token_usage_history.json",
         buffer_multiplier=1.5,
         percentile_threshold=95
     )
-    print(f"✅ TokenBudgetTracker created: {token_tracker}")
-
-    
-    print("✅ Plugins created")
 
     # Create runner (simpler API in your ADK version)
     runner = InMemoryRunner(
         agent=root_agent,
         plugins=[logging_plugin, token_counter, token_tracker]  # ✅ Pass plugins here
     )
-    print(f"✅ Runner created with {len([logging_plugin, token_counter, token_tracker])} plugins")
+    logger.debug("Runner created with %d plugins", len(runner.plugin_manager.plugins))
 
     # Initialize services
 #    session_service = InMemorySessionService()
@@ -120,10 +116,20 @@ def create_runner():
     
     return runner
 
-# ADK looks for this
-runner = create_runner()
+# ADK looks for this. Built lazily on first access (PEP 562) so that importing
+# this module doesn't construct plugins or read token history. The bare
+# annotation declares the name (for __all__ and type checkers) without
+# binding it, so the first lookup still goes through __getattr__.
+runner: InMemoryRunner
+
+
+def __getattr__(name):
+    if name == "runner":
+        runner = globals()["runner"] = create_runner()
+        if _DEBUG:
+            print("✅ Custom runner created and exported!")
+        return runner
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # Also export as __all__ for explicit discovery
 __all__ = ['runner']
-
-print("✅ Custom runner created and exported!") 
\ No newline at end of file
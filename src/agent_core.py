@@ -2,7 +2,16 @@
 
 from __future__ import annotations
 
-from typing import Any, Dict
+import asyncio
+import atexit
+import hashlib
+import re
+import shelve
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional
 
 from src.executor import Executor
 from src.memory import (
@@ -10,8 +19,62 @@ from src.memory import (
     retrieve_from_session,
     store_session,
 )
+from src.paths import plan_cache_path
 from src.planner import Planner
 
+# Response cache: normalized query -> (expires_at, results) (LRU, bounded).
+# Entries expire with the same TTL as the tool result caches (src.cache).
+_RESPONSE_CACHE_MAX = 10_000
+_RESPONSE_CACHE_TTL = 600
+_response_cache: "OrderedDict[str, tuple]" = OrderedDict()
+_response_cache_lock = threading.Lock()
+_WS = re.compile(r"\s+")
+
+
+def _normalize_query(user_input: str) -> str:
+    """Normalize a query so casing/whitespace variants share a cache entry."""
+    return _WS.sub(" ", user_input.strip().upper())
+
+
+def _cache_get(key: str) -> Dict[str, Any] | None:
+    """Return the cached execution results for a query, or None if missing or expired."""
+    with _response_cache_lock:
+        hit = _response_cache.get(key)
+        if hit is None:
+            return None
+        if hit[0] <= time.monotonic():
+            del _response_cache[key]
+            return None
+        _response_cache.move_to_end(key)
+        return hit[1]
+
+
+def _cache_put(key: str, results: Dict[str, Any]) -> None:
+    with _response_cache_lock:
+        _response_cache[key] = (time.monotonic() + _RESPONSE_CACHE_TTL, results)
+        _response_cache.move_to_end(key)
+        while len(_response_cache) > _RESPONSE_CACHE_MAX:
+            _response_cache.popitem(last=False)
+
+# Persistent plan cache: hash(user_input, context) -> plan (survives restarts)
+_plan_cache: Optional[shelve.Shelf] = None
+
+
+def _get_plan_cache() -> shelve.Shelf:
+    """Open the on-disk plan cache on first use."""
+    global _plan_cache
+    if _plan_cache is None:
+        path = Path(plan_cache_path())
+        path.parent.mkdir(parents=True, exist_ok=True)
+        _plan_cache = shelve.open(str(path))
+        atexit.register(_plan_cache.close)
+    return _plan_cache
+
+
+def _plan_key(user_input: str, context: Dict[str, Any] | None) -> str:
+    raw = user_input + repr(sorted((context or {}).items()))
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
 
 class AgentCore:
     """Core agent that orchestrates the workflow: Plan → Execute → Respond."""
@@ -42,20 +105,27 @@ class AgentCore:
             Final response string
         """
         # Step 1: Receive user input (already done)
+        # Repeat of an earlier query: skip planning, tools and LLM, but still
+        # record the interaction in this session's memory
+        cache_key = _normalize_query(user_input)
+        cached = _cache_get(cache_key)
+        if cached is not None:
+            return self._respond(cache_key, user_input, session_id, cached, from_cache=True)
         
         # Step 2: Retrieve relevant memory (optional)
-        context = None
-        if self.use_memory and self.memory and session_id:
-            past_interactions = retrieve_from_session(session_id, user_input, limit=3)
-            if past_interactions:
-                context = {
-                    "past_interactions": past_interactions,
-                    "similar_queries": [p.get("user_input") for p in past_interactions],
-                }
+        context = self._recall(user_input, session_id)
         
-        # Step 3: Plan sub-tasks
+        # Step 3: Plan sub-tasks (identical input + context reuses the cached plan)
         try:
-            plan = self.planner.build_plan(user_input, context)
+            plans = _get_plan_cache()
+            plan_key = _plan_key(user_input, context)
+            plan = plans.get(plan_key)
+            if plan is None:
+                # Warm the executor's latest-year cache while the planner LLM call runs
+                self.executor.prefetch_latest_year()
+                plan = self.planner.build_plan(user_input, context)
+                if not plan.get("fallback"):
+                    plans[plan_key] = plan
         except Exception as e:
             return f"I encountered an error while planning: {str(e)}. Please try rephrasing your query."
         
@@ -65,6 +135,59 @@ class AgentCore:
         except Exception as e:
             return f"I encountered an error while executing: {str(e)}. Please check your query and try again."
         
+        return self._respond(cache_key, user_input, session_id, results)
+
+    async def process_user_input_async(self, user_input: str, session_id: str | None = None) -> str:
+        """
+        Async variant of process_user_input(): the planner and synthesis Gemini
+        calls are awaited, so many sessions can share one event loop.
+        """
+        cache_key = _normalize_query(user_input)
+        cached = _cache_get(cache_key)
+        if cached is not None:
+            return await asyncio.to_thread(self._respond, cache_key, user_input, session_id, cached, True)
+        
+        context = await asyncio.to_thread(self._recall, user_input, session_id)
+        
+        try:
+            plans = _get_plan_cache()
+            plan_key = _plan_key(user_input, context)
+            plan = plans.get(plan_key)
+            if plan is None:
+                self.executor.prefetch_latest_year()
+                plan = await self.planner.build_plan_async(user_input, context)
+                if not plan.get("fallback"):
+                    plans[plan_key] = plan
+        except Exception as e:
+            return f"I encountered an error while planning: {str(e)}. Please try rephrasing your query."
+        
+        try:
+            results = await self.executor.execute_async(plan)
+        except Exception as e:
+            return f"I encountered an error while executing: {str(e)}. Please check your query and try again."
+        
+        return await asyncio.to_thread(self._respond, cache_key, user_input, session_id, results)
+
+    def _recall(self, user_input: str, session_id: str | None) -> Dict[str, Any] | None:
+        """Step 2: memory context from this session's related past interactions, if any."""
+        if self.use_memory and self.memory and session_id:
+            past_interactions = retrieve_from_session(session_id, user_input, limit=3)
+            if past_interactions:
+                return {
+                    "past_interactions": past_interactions,
+                    "similar_queries": [p.get("user_input") for p in past_interactions],
+                }
+        return None
+
+    def _respond(
+        self,
+        cache_key: str,
+        user_input: str,
+        session_id: str | None,
+        results: Dict[str, Any],
+        from_cache: bool = False,
+    ) -> str:
+        """Steps 5-6: pick the final response, store it in memory and the response cache."""
         # Step 5: Generate final response
         if results.get("ok") is False:
             return results.get("final_response", "I encountered an error processing your request.")
@@ -80,6 +203,9 @@ class AgentCore:
             except Exception:
                 pass  # Don't fail if memory storage fails
         
+        # Don't pin the plain-text fallback (Gemini unavailable) in the cache
+        if not from_cache and results.get("final_response") and not results.get("fallback"):
+            _cache_put(cache_key, results)
         return final_response
 
 
@@ -98,3 +224,8 @@ def process_user_input(user_input: str, session_id: str | None = None, use_memor
     agent = AgentCore(use_memory=use_memory)
     return agent.process_user_input(user_input, session_id=session_id)
 
+
+async def run(user_input: str, session_id: str | None = None, use_memory: bool = True) -> str:
+    """Async counterpart of process_user_input(), for callers already in an event loop."""
+    agent = AgentCore(use_memory=use_memory)
+    return await agent.process_user_input_async(user_input, session_id=session_id)
@@ -0,0 +1,83 @@
+"""Small thread-safe TTL cache for memoizing tool results."""
+
+from __future__ import annotations
+
+import functools
+import inspect
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+
+def ttl_cache(maxsize: int = 2048, ttl: float = 600) -> Callable:
+    """
+    Memoize a function for `ttl` seconds, keeping at most `maxsize` entries (LRU).
+
+    Keys are built from all positional and keyword arguments, so they must be
+    hashable. Works on plain and async functions. The wrapper exposes
+    cache_clear() and cache_info().
+    """
+    def decorator(fn: Callable) -> Callable:
+        entries: OrderedDict = OrderedDict()  # key -> (expires_at, value)
+        lock = threading.Lock()
+        stats = {"hits": 0, "misses": 0}
+
+        def lookup(key, now):
+            with lock:
+                hit = entries.get(key)
+                if hit is not None and hit[0] > now:
+                    entries.move_to_end(key)
+                    stats["hits"] += 1
+                    logger.debug("%s cache hit (%s)", fn.__name__, stats)
+                    return True, hit[1]
+                stats["misses"] += 1
+                return False, None
+
+        def store(key, now, value):
+            with lock:
+                entries[key] = (now + ttl, value)
+                entries.move_to_end(key)
+                while len(entries) > maxsize:
+                    entries.popitem(last=False)
+            logger.debug("%s cache miss (%s)", fn.__name__, stats)
+
+        # The call itself happens outside the lock so concurrent misses don't serialize
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                key = (args, tuple(sorted(kwargs.items())))
+                now = time.monotonic()
+                found, value = lookup(key, now)
+                if not found:
+                    value = await fn(*args, **kwargs)
+                    store(key, now, value)
+                return value
+        else:
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                key = (args, tuple(sorted(kwargs.items())))
+                now = time.monotonic()
+                found, value = lookup(key, now)
+                if not found:
+                    value = fn(*args, **kwargs)
+                    store(key, now, value)
+                return value
+
+        def cache_clear() -> None:
+            with lock:
+                entries.clear()
+                stats["hits"] = stats["misses"] = 0
+
+        def cache_info() -> Dict[str, Any]:
+            with lock:
+                return {**stats, "size": len(entries), "maxsize": maxsize, "ttl": ttl}
+
+        wrapper.cache_clear = cache_clear
+        wrapper.cache_info = cache_info
+        return wrapper
+
+    return decorator
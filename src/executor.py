@@ -2,12 +2,16 @@
 
 from __future__ import annotations
 
+import asyncio
+import functools
+import heapq
 import os
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import TYPE_CHECKING, Any, Dict, List
 
-from dotenv import load_dotenv
-import google.generativeai as genai
+if TYPE_CHECKING:
+    import google.generativeai as genai
 
 from src.tools.tools_medicare import medicare_latest_year, medicare_lookup_costs
 from src.tools.tools_ob import (
@@ -15,15 +19,35 @@ from src.tools.tools_ob import (
     ob_ingredient_to_generic_candidates,
     ob_match_identity,
 )
+from src.cache import ttl_cache
 
-# Load environment variables (try .env file, but env vars take precedence)
-env_path = Path(__file__).resolve().parents[1] / ".env"
-if env_path.exists():
-    load_dotenv(env_path)
+# The databases only change on rebuild, and popular drugs repeat, so tool
+# results are memoized for a few minutes (call .cache_clear() to reset).
+medicare_latest_year = ttl_cache(maxsize=1, ttl=600)(medicare_latest_year)
+medicare_lookup_costs = ttl_cache(maxsize=2048, ttl=600)(medicare_lookup_costs)
+ob_match_identity = ttl_cache(maxsize=2048, ttl=600)(ob_match_identity)
+ob_find_equivalents = ttl_cache(maxsize=2048, ttl=600)(ob_find_equivalents)
+ob_ingredient_to_generic_candidates = ttl_cache(maxsize=2048, ttl=600)(ob_ingredient_to_generic_candidates)
+
+# dotenv and google.generativeai (which pulls in gRPC/protobuf) are imported
+# on first Gemini use, not at module import.
+_dotenv_loaded = False
+
+
+def _load_env() -> None:
+    """Load environment variables (try .env file, but env vars take precedence)."""
+    global _dotenv_loaded
+    if not _dotenv_loaded:
+        from dotenv import load_dotenv
+        env_path = Path(__file__).resolve().parents[1] / ".env"
+        if env_path.exists():
+            load_dotenv(env_path)
+        _dotenv_loaded = True
 
 # Initialize Gemini client (lazy - only when needed)
 def _get_api_key() -> str:
     """Get API key from environment variables (like ADK does)."""
+    _load_env()
     # Check environment variables first (works with global env vars)
     api_key = os.getenv("GOOGLE_API_KEY")
     if not api_key:
@@ -33,10 +57,64 @@ def _get_api_key() -> str:
         )
     return api_key
 
+_configured = False
+
+
 def _configure_genai():
-    """Configure Gemini API."""
-    api_key = _get_api_key()
-    genai.configure(api_key=api_key)
+    """Configure Gemini API (once per process)."""
+    global _configured
+    if not _configured:
+        import google.generativeai as genai
+        api_key = _get_api_key()
+        genai.configure(api_key=api_key)
+        _configured = True
+
+
+# Shared across execute() calls; cost lookups are independent local DB reads
+_POOL = ThreadPoolExecutor(max_workers=16, thread_name_prefix="executor")
+
+
+@functools.lru_cache(maxsize=4)
+def _get_model(name: str) -> genai.GenerativeModel:
+    """Configured GenerativeModel for a model name, built once and reused."""
+    import google.generativeai as genai
+    _configure_genai()
+    return genai.GenerativeModel(name)
+
+
+@ttl_cache(maxsize=1024, ttl=1800)
+def _generate_text(model_name: str, prompt: str) -> str:
+    """
+    Gemini completion, memoized on (model, prompt). The synthesis prompt is
+    built only from the drug, identity, year and top-10 costs, so identical
+    cost data reuses the earlier answer. Failures raise and are not cached.
+    """
+    response = _get_model(model_name).generate_content(prompt)
+    return response.text.strip()
+
+
+@ttl_cache(maxsize=1024, ttl=1800)
+async def _generate_text_async(model_name: str, prompt: str) -> str:
+    """Async variant of _generate_text(), for use from an event loop."""
+    response = await _get_model(model_name).generate_content_async(prompt)
+    return response.text.strip()
+
+
+# Only the cheapest rows are ever shown (10 in the prompt, 5 in the fallback)
+_TOP_K = 10
+
+
+def _cost_key(row: Dict[str, Any]) -> float:
+    cost = row.get("cost")
+    return float("inf") if cost is None else cost
+
+
+def _lowest_cost(name: str, year: int) -> Dict[str, Any] | None:
+    """Cheapest Medicare row for a name in the given year, or None."""
+    cost_result = medicare_lookup_costs(name, year=year, limit=1)
+    costs = cost_result.get("items") if cost_result.get("ok") else None
+    # Items come back ordered by avg_spend_per_dose ascending, so the first is the lowest
+    return costs[0] if costs else None
 
 
 class Executor:
@@ -45,6 +123,10 @@ class Executor:
     def __init__(self, model: str = "gemini-2.0-flash-exp"):
         self.model = model
 
+    def prefetch_latest_year(self) -> Future:
+        """Start the (cached) latest-year lookup in the background, e.g. while planning."""
+        return _POOL.submit(medicare_latest_year)
+
     def execute(self, plan: Dict[str, Any]) -> Dict[str, Any]:
         """
         Execute the planned tasks.
@@ -55,6 +137,29 @@ class Executor:
         Returns:
             Dictionary with execution results
         """
+        results = self._run_tools(plan)
+        if results.get("ok") is False:
+            return results
+        try:
+            # Step 5: Rank by cost and generate final response using Gemini
+            results["final_response"] = self._synthesize_response(results)
+        except Exception as e:
+            return self._error_response(f"Execution error: {str(e)}")
+        return results
+
+    async def execute_async(self, plan: Dict[str, Any]) -> Dict[str, Any]:
+        """Async variant of execute(): tool calls run in a worker thread, synthesis is awaited."""
+        results = await asyncio.to_thread(self._run_tools, plan)
+        if results.get("ok") is False:
+            return results
+        try:
+            results["final_response"] = await self._synthesize_response_async(results)
+        except Exception as e:
+            return self._error_response(f"Execution error: {str(e)}")
+        return results
+
+    def _run_tools(self, plan: Dict[str, Any]) -> Dict[str, Any]:
+        """Steps 1-4: year, identity, equivalents and costs. Returns results or an error response."""
         drug_name = plan.get("drug_name", "")
         strength = plan.get("strength") or ""
         dosage_form = plan.get("dosage_form")
@@ -69,8 +174,12 @@ class Executor:
         }
         
         try:
+            # Steps 1 and 2 are independent: run the year and identity lookups together
+            year_future = _POOL.submit(medicare_latest_year)
+            identity_future = _POOL.submit(ob_match_identity, drug_name, strength)
+
             # Step 1: Get latest Medicare year
-            year_result = medicare_latest_year()
+            year_result = year_future.result()
             if year_result.get("ok"):
                 latest_year = year_result["latest_year"]
                 results["latest_year"] = latest_year
@@ -78,7 +187,7 @@ class Executor:
                 return self._error_response("Could not retrieve Medicare year data")
             
             # Step 2: Match drug identity
-            identity_result = ob_match_identity(drug_name, strength)
+            identity_result = identity_future.result()
             if not identity_result.get("ok"):
                 return self._error_response(
                     f"Could not find drug '{drug_name}' in Orange Book. "
@@ -109,93 +218,119 @@ class Executor:
             equivalents = equiv_result["items"]
             results["equivalents"] = equivalents
             
-            # Step 4: Lookup costs for each equivalent
+            # Step 4: Lookup costs for each equivalent (concurrently, results kept in order)
             cost_data = []
-            for equiv in equivalents:
-                trade_name = equiv.get("trade_name", "")
-                if not trade_name:
-                    continue
-                
-                cost_result = medicare_lookup_costs(trade_name, year=latest_year, limit=5)
-                if cost_result.get("ok") and cost_result.get("items"):
-                    costs = cost_result["items"]
-                    # Get lowest cost
-                    if costs:
-                        lowest = min(costs, key=lambda x: x.get("avg_spend_per_dose", float("inf")))
-                        cost_data.append({
-                            "trade_name": trade_name,
-                            "is_generic": equiv.get("is_generic", False),
-                            "cost": lowest.get("avg_spend_per_dose"),
-                            "manufacturer": lowest.get("manufacturer"),
-                            "details": lowest,
-                        })
-                        results["costs"][trade_name] = lowest
+            named = [e for e in equivalents if e.get("trade_name")]
+            # Orange Book lists many products under the same trade name (often in
+            # different casing); look each distinct name up once.
+            unique: Dict[str, str] = {}
+            for e in named:
+                unique.setdefault(e["trade_name"].strip().lower(), e["trade_name"])
+            by_name = dict(zip(unique, _POOL.map(lambda n: _lowest_cost(n, latest_year), unique.values())))
+            for equiv in named:
+                lowest = by_name[equiv["trade_name"].strip().lower()]
+                if lowest:
+                    trade_name = equiv["trade_name"]
+                    cost_data.append({
+                        "trade_name": trade_name,
+                        "is_generic": equiv.get("is_generic", False),
+                        "cost": lowest.get("avg_spend_per_dose"),
+                        "manufacturer": lowest.get("manufacturer"),
+                        "details": lowest,
+                    })
+                    results["costs"][trade_name] = lowest
             
             # If no costs found, try generic candidates fallback
             if not cost_data:
                 generic_result = ob_ingredient_to_generic_candidates(ingredient)
                 if generic_result.get("ok") and generic_result.get("candidates"):
-                    for candidate in generic_result["candidates"][:5]:
-                        cost_result = medicare_lookup_costs(candidate, year=latest_year, limit=5)
-                        if cost_result.get("ok") and cost_result.get("items"):
-                            costs = cost_result["items"]
-                            if costs:
-                                lowest = min(costs, key=lambda x: x.get("avg_spend_per_dose", float("inf")))
-                                cost_data.append({
-                                    "trade_name": candidate,
-                                    "is_generic": True,
-                                    "cost": lowest.get("avg_spend_per_dose"),
-                                    "manufacturer": lowest.get("manufacturer"),
-                                    "details": lowest,
-                                })
+                    candidates = generic_result["candidates"][:5]
+                    lowests = _POOL.map(lambda c: _lowest_cost(c, latest_year), candidates)
+                    for candidate, lowest in zip(candidates, lowests):
+                        if lowest:
+                            cost_data.append({
+                                "trade_name": candidate,
+                                "is_generic": True,
+                                "cost": lowest.get("avg_spend_per_dose"),
+                                "manufacturer": lowest.get("manufacturer"),
+                                "details": lowest,
+                            })
             
             if not cost_data:
                 return self._error_response(
                     f"Found equivalents but no Medicare cost data available for year {latest_year}"
                 )
             
-            # Step 5: Rank by cost and generate final response using Gemini
             results["cost_data"] = cost_data
-            results["final_response"] = self._synthesize_response(
-                drug_name=drug_name,
-                identity=identity,
-                cost_data=cost_data,
-                latest_year=latest_year,
-            )
-            
+            # Rank once, keeping only the top K (O(N log K)); synthesis and the text fallback share it
+            results["sorted_costs"] = heapq.nsmallest(_TOP_K, cost_data, key=_cost_key)
             return results
             
         except Exception as e:
             return self._error_response(f"Execution error: {str(e)}")
 
-    def _synthesize_response(
+    @staticmethod
+    def _synthesis_args(results: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "drug_name": results["plan"].get("drug_name", ""),
+            "identity": results["identity"],
+            "sorted_costs": results["sorted_costs"],
+            "total": len(results["cost_data"]),
+            "latest_year": results["latest_year"],
+        }
+
+    def _synthesize_response(self, results: Dict[str, Any]) -> str:
+        """
+        Use Gemini to synthesize a natural language response from cost-sorted rows.
+
+        If Gemini fails, returns the plain-text summary and sets
+        results["fallback"] so callers don't cache the degraded answer.
+        """
+        args = self._synthesis_args(results)
+        synthesis_prompt = self._synthesis_prompt(**args)
+        try:
+            return _generate_text(self.model, synthesis_prompt)
+        except Exception:
+            # Fallback to simple text response
+            results["fallback"] = True
+            return self._simple_response(args["sorted_costs"], args["total"], args["latest_year"])
+
+    async def _synthesize_response_async(self, results: Dict[str, Any]) -> str:
+        """Async variant of _synthesize_response()."""
+        args = self._synthesis_args(results)
+        synthesis_prompt = self._synthesis_prompt(**args)
+        try:
+            return await _generate_text_async(self.model, synthesis_prompt)
+        except Exception:
+            results["fallback"] = True
+            return self._simple_response(args["sorted_costs"], args["total"], args["latest_year"])
+
+    def _synthesis_prompt(
         self,
         drug_name: str,
         identity: Dict[str, Any],
-        cost_data: List[Dict[str, Any]],
+        sorted_costs: List[Dict[str, Any]],
+        total: int,
         latest_year: int,
     ) -> str:
-        """Use Gemini to synthesize a natural language response."""
-        # Sort by cost
-        sorted_costs = sorted(cost_data, key=lambda x: x.get("cost", float("inf")))
-        
-        synthesis_prompt = f"""You are a helpful drug cost comparison assistant.
+        """Build the synthesis prompt from cost-sorted rows."""
+        parts = [f"""You are a helpful drug cost comparison assistant.
 
 User asked about: {drug_name}
 Original drug identity: {identity.get('trade_name', 'N/A')} ({identity.get('ingredient', 'N/A')}, {identity.get('strength', 'N/A')})
 
-I found {len(sorted_costs)} therapeutic equivalent options with Medicare Part D cost data for year {latest_year}.
+I found {total} therapeutic equivalent options with Medicare Part D cost data for year {latest_year}.
 
 Cost data (sorted by lowest cost):
-"""
-        for i, item in enumerate(sorted_costs[:10], 1):
+"""]
+        for i, item in enumerate(sorted_costs[:_TOP_K], 1):
             cost = item.get("cost", 0)
             trade_name = item.get("trade_name", "N/A")
             is_generic = item.get("is_generic", False)
             manufacturer = item.get("manufacturer", "N/A")
-            synthesis_prompt += f"{i}. {trade_name} ({'Generic' if is_generic else 'Brand'}) - ${cost:.2f} per dose unit (Manufacturer: {manufacturer})\n"
+            parts.append(f"{i}. {trade_name} ({'Generic' if is_generic else 'Brand'}) - ${cost:.2f} per dose unit (Manufacturer: {manufacturer})\n")
 
-        synthesis_prompt += f"""
+        parts.append(f"""
 
 Generate a clear, helpful response that:
 1. Confirms the drug identity found
@@ -204,32 +339,22 @@ Generate a clear, helpful response that:
 4. Notes that actual copay may differ
 5. Suggests consulting a pharmacist for specific alternatives
 
-Be concise but informative. Format nicely."""
-
-        try:
-            _configure_genai()  # Ensure API is configured
-            model = genai.GenerativeModel(self.model)
-            response = model.generate_content(synthesis_prompt)
-            return response.text.strip()
-        except Exception as e:
-            # Fallback to simple text response
-            return self._simple_response(sorted_costs, latest_year)
+Be concise but informative. Format nicely.""")
+        return "".join(parts)
 
     def _simple_response(
-        self, cost_data: List[Dict[str, Any]], latest_year: int
+        self, sorted_costs: List[Dict[str, Any]], total: int, latest_year: int
     ) -> str:
-        """Fallback simple text response without LLM."""
-        sorted_costs = sorted(cost_data, key=lambda x: x.get("cost", float("inf")))
-        
-        response = f"Found {len(sorted_costs)} therapeutic equivalent options (Medicare Part D, {latest_year}):\n\n"
+        """Fallback simple text response without LLM (expects cost-sorted rows)."""
+        parts = [f"Found {total} therapeutic equivalent options (Medicare Part D, {latest_year}):\n\n"]
         for i, item in enumerate(sorted_costs[:5], 1):
             cost = item.get("cost", 0)
             trade_name = item.get("trade_name", "N/A")
             is_generic = item.get("is_generic", False)
-            response += f"{i}. {trade_name} ({'Generic' if is_generic else 'Brand'}) - ${cost:.2f} per dose unit\n"
+            parts.append(f"{i}. {trade_name} ({'Generic' if is_generic else 'Brand'}) - ${cost:.2f} per dose unit\n")
         
-        response += f"\nNote: This is program-level Medicare Part D data for {latest_year}. Actual copay may differ. Consult your pharmacist."
-        return response
+        parts.append(f"\nNote: This is program-level Medicare Part D data for {latest_year}. Actual copay may differ. Consult your pharmacist.")
+        return "".join(parts)
 
     def _error_response(self, error_msg: str) -> Dict[str, Any]:
         """Create an error response structure."""
@@ -2,63 +2,152 @@
 
 from __future__ import annotations
 
-import json
-import os
+import re
+import sqlite3
+import threading
+import time
 from pathlib import Path
 from typing import Any, Dict, List, Optional
-from datetime import datetime, timedelta
+from datetime import datetime
 import uuid
 
+from src import jsonio
+from src.paths import sessions_db_path
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS interactions (
+    id INTEGER PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    ts TEXT NOT NULL,
+    ts_epoch REAL NOT NULL DEFAULT 0,
+    user_input TEXT,
+    response TEXT,
+    drug_name TEXT,
+    data_json TEXT
+);
+-- Inverted index: keyword -> interactions whose query/drug name contain it
+CREATE TABLE IF NOT EXISTS interaction_keywords (
+    session_id TEXT NOT NULL,
+    keyword TEXT NOT NULL,
+    interaction_id INTEGER NOT NULL,
+    PRIMARY KEY (session_id, keyword, interaction_id)
+) WITHOUT ROWID;
+"""
+
+# Created after the ts_epoch migration below
+_INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_interactions_session_ts ON interactions(session_id, ts_epoch);
+CREATE INDEX IF NOT EXISTS idx_interactions_ts ON interactions(ts_epoch);
+"""
+
+# Memory lookback window
+_RECENT_SECONDS = 24 * 3600
+
+_KEYWORD = re.compile(r"\w{4,}")
+
+
+def _keywords(text: str) -> set[str]:
+    """Lowercased words of 4+ characters, as used for retrieval matching."""
+    return set(_KEYWORD.findall(text.lower()))
+
+# Keep at most this many interactions per session
+_MAX_INTERACTIONS = 50
+
 
 class SessionMemory:
-    """Session-based memory storage with persistence to disk."""
+    """Session-based memory storage persisted in SQLite (Data/sessions.db)."""
 
     def __init__(self, storage_file: str | None = None):
         """
         Initialize session memory.
         
         Args:
-            storage_file: Path to JSON file for persistence. If None, uses default.
+            storage_file: Path to the SQLite database. If None, uses default.
         """
         if storage_file is None:
-            # Default: store in Data/sessions.json
-            repo_root = Path(__file__).resolve().parents[1]
-            data_dir = repo_root / "Data"
-            data_dir.mkdir(exist_ok=True)
-            storage_file = str(data_dir / "sessions.json")
+            # Default: store in Data/sessions.db
+            storage_file = sessions_db_path()
+            Path(storage_file).parent.mkdir(exist_ok=True)
         
         self.storage_file = storage_file
-        self.sessions: Dict[str, Dict[str, Any]] = {}
-        self._load_sessions()
-
-    def _load_sessions(self) -> None:
-        """Load sessions from disk."""
-        if os.path.exists(self.storage_file):
-            try:
-                with open(self.storage_file, "r", encoding="utf-8") as f:
-                    self.sessions = json.load(f)
-            except (json.JSONDecodeError, IOError):
-                self.sessions = {}
-
-    def _save_sessions(self) -> None:
-        """Save sessions to disk."""
-        try:
-            with open(self.storage_file, "w", encoding="utf-8") as f:
-                json.dump(self.sessions, f, indent=2, ensure_ascii=False)
-        except IOError:
-            pass  # Don't fail if save fails
+        # One connection shared by all threads; the lock serializes access to it
+        self._lock = threading.Lock()
+        self._con = sqlite3.connect(storage_file, check_same_thread=False, isolation_level=None)
+        self._con.execute("PRAGMA journal_mode=WAL;")
+        self._con.execute("PRAGMA synchronous=NORMAL;")
+        # Bound resident memory: SQLite's page cache is an LRU, cap it at ~8 MB
+        # (hot sessions stay cached, cold ones are read back from disk on demand),
+        # and truncate the WAL after checkpoints instead of letting it grow.
+        self._con.execute("PRAGMA cache_size=-8192;")
+        self._con.execute("PRAGMA journal_size_limit=67108864;")
+        self._con.executescript(_SCHEMA)
+        self._migrate()
+        self._con.executescript(_INDEXES)
+
+    def _migrate(self) -> None:
+        """Bring databases created by older versions up to the current schema."""
+        columns = {r[1] for r in self._con.execute("PRAGMA table_info(interactions)")}
+        if "ts_epoch" not in columns:
+            self._add_ts_epoch()
+        if not self._con.execute("SELECT 1 FROM interaction_keywords LIMIT 1").fetchone():
+            rows = self._con.execute("SELECT id, session_id, user_input, drug_name FROM interactions").fetchall()
+            with self._con:
+                self._con.execute("BEGIN")
+                for interaction_id, session_id, user_input, drug_name in rows:
+                    self._index_keywords(session_id, interaction_id, user_input, drug_name)
+
+    def _index_keywords(self, session_id: str, interaction_id: int, user_input: str | None, drug_name: str | None) -> None:
+        self._con.executemany(
+            "INSERT OR IGNORE INTO interaction_keywords (session_id, keyword, interaction_id) VALUES (?, ?, ?)",
+            [(session_id, k, interaction_id) for k in _keywords(f"{user_input or ''} {drug_name or ''}")],
+        )
+
+    def _add_ts_epoch(self) -> None:
+        """Add and backfill ts_epoch on databases created before it existed."""
+        with self._con:
+            self._con.execute("BEGIN")
+            self._con.execute("DROP INDEX IF EXISTS idx_interactions_session_ts")
+            self._con.execute("DROP INDEX IF EXISTS idx_interactions_ts")
+            self._con.execute("ALTER TABLE interactions ADD COLUMN ts_epoch REAL NOT NULL DEFAULT 0")
+            rows = self._con.execute("SELECT id, ts FROM interactions").fetchall()
+            self._con.executemany(
+                "UPDATE interactions SET ts_epoch = ? WHERE id = ?",
+                [(datetime.fromisoformat(ts).timestamp(), i) for i, ts in rows],
+            )
+
+    def _query(self, sql: str, params: tuple = ()) -> List[tuple]:
+        with self._lock:
+            return self._con.execute(sql, params).fetchall()
+
+    @staticmethod
+    def _entry(row: tuple) -> Dict[str, Any]:
+        """Rebuild an interaction dict from (ts, user_input, response, drug_name, data_json)."""
+        ts, user_input, response, drug_name, data_json = row
+        data = jsonio.loads(data_json) if data_json else {}
+        return {
+            "timestamp": ts,
+            "user_input": user_input,
+            "response": response,
+            "drug_name": drug_name,
+            "identity": data.get("identity"),
+            "cost_data": data.get("cost_data", []),
+            "metadata": data.get("metadata", {}),
+        }
 
     def get_or_create_session(self, session_id: str) -> Dict[str, Any]:
         """Get existing session or create a new one."""
-        if session_id not in self.sessions:
-            self.sessions[session_id] = {
-                "session_id": session_id,
-                "created_at": datetime.now().isoformat(),
-                "updated_at": datetime.now().isoformat(),
-                "interactions": [],
-            }
-            self._save_sessions()
-        return self.sessions[session_id]
+        now = datetime.now().isoformat()
+        with self._lock:
+            self._con.execute(
+                "INSERT OR IGNORE INTO sessions (session_id, created_at, updated_at) VALUES (?, ?, ?)",
+                (session_id, now, now),
+            )
+        return self.get_session(session_id)
 
     def store(
         self,
@@ -78,31 +167,62 @@ class SessionMemory:
             response: Final response text
             metadata: Optional additional metadata
         """
-        session = self.get_or_create_session(session_id)
-        
-        entry = {
-            "timestamp": datetime.now().isoformat(),
-            "user_input": user_input,
-            "response": response,
-            "drug_name": results.get("plan", {}).get("drug_name"),
+        now_epoch = time.time()
+        now = datetime.fromtimestamp(now_epoch).isoformat()
+        data = {
             "identity": results.get("identity"),
             "cost_data": results.get("cost_data", [])[:5],  # Store top 5
             "metadata": metadata or {},
         }
         
-        session["interactions"].append(entry)
-        session["updated_at"] = datetime.now().isoformat()
-        
-        # Limit interactions per session
-        max_interactions = 50
-        if len(session["interactions"]) > max_interactions:
-            session["interactions"] = session["interactions"][-max_interactions:]
-        
-        self._save_sessions()
+        with self._lock, self._con:
+            self._con.execute("BEGIN")
+            self._con.execute(
+                "INSERT INTO sessions (session_id, created_at, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET updated_at = excluded.updated_at",
+                (session_id, now, now),
+            )
+            drug_name = results.get("plan", {}).get("drug_name")
+            cur = self._con.execute(
+                "INSERT INTO interactions (session_id, ts, ts_epoch, user_input, response, drug_name, data_json) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    session_id, now, now_epoch, user_input, response, drug_name,
+                    jsonio.dumps(data),
+                ),
+            )
+            self._index_keywords(session_id, cur.lastrowid, user_input, drug_name)
+            # Limit interactions per session
+            self._con.execute(
+                "DELETE FROM interactions WHERE session_id = ? AND id NOT IN "
+                "(SELECT id FROM interactions WHERE session_id = ? ORDER BY id DESC LIMIT ?)",
+                (session_id, session_id, _MAX_INTERACTIONS),
+            )
+            self._con.execute(
+                "DELETE FROM interaction_keywords WHERE session_id = ? AND interaction_id NOT IN "
+                "(SELECT id FROM interactions WHERE session_id = ?)",
+                (session_id, session_id),
+            )
 
     def get_session(self, session_id: str) -> Dict[str, Any] | None:
         """Get a specific session by ID."""
-        return self.sessions.get(session_id)
+        rows = self._query(
+            "SELECT created_at, updated_at FROM sessions WHERE session_id = ?", (session_id,)
+        )
+        if not rows:
+            return None
+        created_at, updated_at = rows[0]
+        interactions = self._query(
+            "SELECT ts, user_input, response, drug_name, data_json FROM interactions "
+            "WHERE session_id = ? ORDER BY id",
+            (session_id,),
+        )
+        return {
+            "session_id": session_id,
+            "created_at": created_at,
+            "updated_at": updated_at,
+            "interactions": [self._entry(r) for r in interactions],
+        }
 
     def list_sessions(self, limit: int = 50, last_24h_only: bool = False) -> List[Dict[str, Any]]:
         """
@@ -115,37 +235,35 @@ class SessionMemory:
         Returns:
             List of session summaries
         """
-        cutoff_time = datetime.now() - timedelta(hours=24) if last_24h_only else None
+        cutoff = time.time() - _RECENT_SECONDS if last_24h_only else 0
         
-        sessions_list = []
-        for session_id, session_data in self.sessions.items():
-            interactions = session_data.get("interactions", [])
-            
-            # Filter to last 24h if requested
-            if last_24h_only and cutoff_time:
-                recent_interactions = [
-                    i for i in interactions
-                    if i.get("timestamp") and datetime.fromisoformat(i.get("timestamp", "")) >= cutoff_time
-                ]
-                if not recent_interactions:
-                    continue  # Skip sessions with no recent interactions
-                interactions = recent_interactions
-            
-            if not interactions:
-                continue
-            
-            sessions_list.append({
+        # Per session: count plus first/last query among the (optionally recent) interactions
+        rows = self._query(
+            """
+            SELECT s.session_id, s.created_at, s.updated_at, COUNT(*),
+                   (SELECT user_input FROM interactions f
+                    WHERE f.session_id = s.session_id AND f.ts_epoch >= ? ORDER BY f.id LIMIT 1),
+                   (SELECT user_input FROM interactions l
+                    WHERE l.session_id = s.session_id AND l.ts_epoch >= ? ORDER BY l.id DESC LIMIT 1)
+            FROM sessions s
+            JOIN interactions i ON i.session_id = s.session_id AND i.ts_epoch >= ?
+            GROUP BY s.session_id
+            ORDER BY s.updated_at DESC
+            LIMIT ?
+            """,
+            (cutoff, cutoff, cutoff, limit),
+        )
+        return [
+            {
                 "session_id": session_id,
-                "created_at": session_data.get("created_at"),
-                "updated_at": session_data.get("updated_at"),
-                "interaction_count": len(interactions),
-                "first_query": interactions[0].get("user_input", "") if interactions else "",
-                "last_query": interactions[-1].get("user_input", "") if interactions else "",
-            })
-        
-        # Sort by updated_at, most recent first
-        sessions_list.sort(key=lambda x: x.get("updated_at", ""), reverse=True)
-        return sessions_list[:limit]
+                "created_at": created_at,
+                "updated_at": updated_at,
+                "interaction_count": count,
+                "first_query": first or "",
+                "last_query": last or "",
+            }
+            for session_id, created_at, updated_at, count, first, last in rows
+        ]
 
     def retrieve_from_session(self, session_id: str, user_input: str, limit: int = 5) -> List[Dict[str, Any]]:
         """
@@ -159,96 +277,60 @@ class SessionMemory:
         Returns:
             List of relevant past interactions from last 24 hours
         """
-        session = self.get_session(session_id)
-        if not session or not session.get("interactions"):
+        words = sorted(_keywords(user_input))
+        if not words:
             return []
         
-        # Filter to last 24 hours
-        cutoff_time = datetime.now() - timedelta(hours=24)
-        
-        # Simple keyword matching
-        user_lower = user_input.lower()
-        relevant = []
-        
-        interactions = session["interactions"]
-        for entry in reversed(interactions):  # Most recent first
-            # Check if entry is within last 24 hours
-            entry_time_str = entry.get("timestamp", "")
-            if entry_time_str:
-                try:
-                    entry_time = datetime.fromisoformat(entry_time_str)
-                    if entry_time < cutoff_time:
-                        continue  # Skip entries older than 24 hours
-                except (ValueError, TypeError):
-                    pass  # If timestamp parsing fails, include it anyway
-            
-            entry_input = entry.get("user_input", "").lower()
-            drug_name = entry.get("drug_name", "").lower()
-            
-            # Check if any keywords match
-            if any(word in entry_input or word in drug_name for word in user_lower.split() if len(word) > 3):
-                relevant.append(entry)
-                if len(relevant) >= limit:
-                    break
-        
-        return relevant
+        # Keyword index lookup, filtered to last 24 hours, most recent first
+        cutoff = time.time() - _RECENT_SECONDS
+        rows = self._query(
+            f"""
+            SELECT ts, user_input, response, drug_name, data_json FROM interactions
+            WHERE id IN (
+                SELECT interaction_id FROM interaction_keywords
+                WHERE session_id = ? AND keyword IN ({",".join("?" * len(words))})
+            )
+              AND ts_epoch >= ?
+            ORDER BY ts_epoch DESC, id DESC
+            LIMIT ?
+            """,
+            (session_id, *words, cutoff, limit),
+        )
+        return [self._entry(r) for r in rows]
     
-    def get_recent_24h(self, session_id: str | None = None) -> List[Dict[str, Any]]:
+    def get_recent_24h(self, session_id: str | None = None, limit: int | None = None) -> List[Dict[str, Any]]:
         """
         Get all interactions from the last 24 hours.
         
         Args:
             session_id: Optional session ID. If None, returns from all sessions.
+            limit: Optional maximum number of (most recent) interactions to return.
             
         Returns:
-            List of all interactions from last 24 hours
+            List of all interactions from last 24 hours, most recent first
         """
-        cutoff_time = datetime.now() - timedelta(hours=24)
-        recent_interactions = []
-        
+        cutoff = time.time() - _RECENT_SECONDS
+        sql = "SELECT ts, user_input, response, drug_name, data_json FROM interactions WHERE ts_epoch >= ?"
+        params: tuple = (cutoff,)
         if session_id:
-            # Get from specific session
-            session = self.get_session(session_id)
-            if session:
-                interactions = session.get("interactions", [])
-                for entry in interactions:
-                    entry_time_str = entry.get("timestamp", "")
-                    if entry_time_str:
-                        try:
-                            entry_time = datetime.fromisoformat(entry_time_str)
-                            if entry_time >= cutoff_time:
-                                recent_interactions.append(entry)
-                        except (ValueError, TypeError):
-                            pass
-        else:
-            # Get from all sessions
-            for session_data in self.sessions.values():
-                interactions = session_data.get("interactions", [])
-                for entry in interactions:
-                    entry_time_str = entry.get("timestamp", "")
-                    if entry_time_str:
-                        try:
-                            entry_time = datetime.fromisoformat(entry_time_str)
-                            if entry_time >= cutoff_time:
-                                recent_interactions.append(entry)
-                        except (ValueError, TypeError):
-                            pass
-        
-        # Sort by timestamp, most recent first
-        recent_interactions.sort(
-            key=lambda x: datetime.fromisoformat(x.get("timestamp", "1970-01-01")),
-            reverse=True
-        )
-        
-        return recent_interactions
+            sql += " AND session_id = ?"
+            params += (session_id,)
+        sql += " ORDER BY ts_epoch DESC, id DESC"
+        if limit is not None:
+            # Top-N in SQL (served by the ts_epoch index), not fetch-all-then-slice
+            sql += " LIMIT ?"
+            params += (int(limit),)
+        rows = self._query(sql, params)
+        return [self._entry(r) for r in rows]
 
     def delete_session(self, session_id: str) -> bool:
         """Delete a session."""
-        if session_id in self.sessions:
-            del self.sessions[session_id]
-            self._save_sessions()
-            return True
-        return False
+        with self._lock, self._con:
+            self._con.execute("BEGIN")
+            self._con.execute("DELETE FROM interactions WHERE session_id = ?", (session_id,))
+            self._con.execute("DELETE FROM interaction_keywords WHERE session_id = ?", (session_id,))
+            cur = self._con.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            return cur.rowcount > 0
 
 
 # Global memory instance
@@ -279,9 +361,9 @@ def retrieve_from_session(session_id: str, user_input: str, limit: int = 5) -> L
     return get_memory().retrieve_from_session(session_id, user_input, limit)
 
 
-def get_recent_24h(session_id: str | None = None) -> List[Dict[str, Any]]:
+def get_recent_24h(session_id: str | None = None, limit: int | None = None) -> List[Dict[str, Any]]:
     """Convenience function to get all interactions from last 24 hours."""
-    return get_memory().get_recent_24h(session_id)
+    return get_memory().get_recent_24h(session_id, limit)
 
 
 def get_session(session_id: str) -> Dict[str, Any] | None:
@@ -2,19 +2,36 @@ from __future__ import annotations
 
 from pathlib import Path
 
+# Resolved once at import; the accessors below just return these strings
+_REPO_ROOT = Path(__file__).resolve().parents[1]
+_DATA_DIR = _REPO_ROOT / "Data"
+_PRODUCTS_DB = str(_DATA_DIR / "products.db")
+_MEDICARE_DB = str(_DATA_DIR / "medicare.db")
+_PLAN_CACHE = str(_DATA_DIR / "plan_cache" / "plans")
+_SESSIONS_DB = str(_DATA_DIR / "sessions.db")
+
 
 def _get_data_dir() -> Path:
     """Return the Data directory path relative to the project root."""
-    repo_root = Path(__file__).resolve().parents[1]
-    return repo_root / "Data"
+    return _DATA_DIR
 
 
 def products_db_path() -> str:
     """Return the path to products.db (Orange Book data)."""
-    return str(_get_data_dir() / "products.db")
+    return _PRODUCTS_DB
 
 
 def medicare_db_path() -> str:
     """Return the path to medicare.db (CMS Part D data)."""
-    return str(_get_data_dir() / "medicare.db")
+    return _MEDICARE_DB
+
+
+
+def plan_cache_path() -> str:
+    """Return the path (shelve base name) of the persistent planner cache."""
+    return _PLAN_CACHE
+
 
+def sessions_db_path() -> str:
+    """Return the path to sessions.db (session memory)."""
+    return _SESSIONS_DB
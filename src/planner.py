@@ -2,21 +2,45 @@
 
 from __future__ import annotations
 
+import functools
 import os
+import re
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import TYPE_CHECKING, Any, Dict, List
 
-from dotenv import load_dotenv
-import google.generativeai as genai
+from src import jsonio
 
-# Load environment variables (try .env file, but env vars take precedence)
-env_path = Path(__file__).resolve().parents[1] / ".env"
-if env_path.exists():
-    load_dotenv(env_path)
+if TYPE_CHECKING:
+    import google.generativeai as genai
+
+# Fallback (non-LLM) extraction patterns, compiled once
+_STRENGTH_RE = re.compile(r'(\d+(?:\.\d+)?)\s*(mg|mcg|g|ml|%|units?)', re.IGNORECASE)
+_WORD_RE = re.compile(r'[a-z]+')
+# Dosage forms in priority order (first match wins)
+_FORMS = ('tablet', 'capsule', 'injection', 'cream', 'ointment', 'solution', 'suspension')
+
+# How often build_plan could skip the LLM (see Planner._fast_plan)
+plan_stats = {"fast_path": 0, "llm": 0}
+
+# dotenv and google.generativeai (which pulls in gRPC/protobuf) are imported
+# on first Gemini use, not at module import.
+_dotenv_loaded = False
+
+
+def _load_env() -> None:
+    """Load environment variables (try .env file, but env vars take precedence)."""
+    global _dotenv_loaded
+    if not _dotenv_loaded:
+        from dotenv import load_dotenv
+        env_path = Path(__file__).resolve().parents[1] / ".env"
+        if env_path.exists():
+            load_dotenv(env_path)
+        _dotenv_loaded = True
 
 # Initialize Gemini client (lazy - only when needed)
 def _get_api_key() -> str:
     """Get API key from environment variables (like ADK does)."""
+    _load_env()
     # Check environment variables first (works with global env vars)
     api_key = os.getenv("GOOGLE_API_KEY")
     if not api_key:
@@ -26,10 +50,25 @@ def _get_api_key() -> str:
         )
     return api_key
 
+_configured = False
+
+
 def _configure_genai():
-    """Configure Gemini API."""
-    api_key = _get_api_key()
-    genai.configure(api_key=api_key)
+    """Configure Gemini API (once per process)."""
+    global _configured
+    if not _configured:
+        import google.generativeai as genai
+        api_key = _get_api_key()
+        genai.configure(api_key=api_key)
+        _configured = True
+
+
+@functools.lru_cache(maxsize=4)
+def _get_model(name: str) -> genai.GenerativeModel:
+    """Configured GenerativeModel for a model name, built once and reused."""
+    import google.generativeai as genai
+    _configure_genai()
+    return genai.GenerativeModel(name)
 
 
 class Planner:
@@ -55,7 +94,54 @@ class Planner:
                 "tasks": List[str]  # Ordered list of sub-tasks
             }
         """
-        planning_prompt = f"""You are a task planner for a drug cost comparison agent.
+        plan = self._fast_plan(user_input)
+        if plan is not None:
+            return plan
+        
+        planning_prompt = self._planning_prompt(user_input)
+        try:
+            response = _get_model(self.model).generate_content(planning_prompt)
+            return self._parse_plan(response.text)
+        except Exception:
+            # Fallback: simple extraction without LLM (flagged so callers don't cache it)
+            plan = self._simple_plan(user_input)
+            plan["fallback"] = True
+            return plan
+
+    async def build_plan_async(self, user_input: str, context: Dict[str, Any] | None = None) -> Dict[str, Any]:
+        """Async variant of build_plan() using generate_content_async."""
+        plan = self._fast_plan(user_input)
+        if plan is not None:
+            return plan
+        
+        planning_prompt = self._planning_prompt(user_input)
+        try:
+            response = await _get_model(self.model).generate_content_async(planning_prompt)
+            return self._parse_plan(response.text)
+        except Exception:
+            plan = self._simple_plan(user_input)
+            plan["fallback"] = True
+            return plan
+
+    def _fast_plan(self, user_input: str) -> Dict[str, Any] | None:
+        """
+        Deterministic plan for well-formed queries like "metformin 500mg tablet":
+        a strength plus a single drug word (once strength and form are removed).
+        Returns None when the query needs the LLM.
+        """
+        plan = self._simple_plan(user_input)
+        if plan["strength"] is not None:
+            rest = _STRENGTH_RE.sub(" ", user_input).lower()
+            words = [w for w in _WORD_RE.findall(rest) if (w[:-1] if w.endswith('s') else w) not in _FORMS]
+            if len(words) == 1 and len(words[0]) >= 3 and not any(c.isdigit() for c in rest):
+                plan["drug_name"] = words[0]
+                plan_stats["fast_path"] += 1
+                return plan
+        plan_stats["llm"] += 1
+        return None
+
+    def _planning_prompt(self, user_input: str) -> str:
+        return f"""You are a task planner for a drug cost comparison agent.
 
 User query: "{user_input}"
 
@@ -87,34 +173,25 @@ Return a JSON object with this structure:
 
 Only return valid JSON, no additional text."""
 
-        try:
-            _configure_genai()  # Ensure API is configured
-            model = genai.GenerativeModel(self.model)
-            response = model.generate_content(planning_prompt)
-            
-            # Parse JSON response
-            import json
-            plan_text = response.text.strip()
-            # Remove markdown code blocks if present
-            if plan_text.startswith("```"):
-                plan_text = plan_text.split("```")[1]
-                if plan_text.startswith("json"):
-                    plan_text = plan_text[4:]
-            plan_text = plan_text.strip()
-            
-            plan = json.loads(plan_text)
-            
-            # Ensure required fields
-            plan.setdefault("drug_name", "")
-            plan.setdefault("strength", None)
-            plan.setdefault("dosage_form", None)
-            plan.setdefault("tasks", [])
-            
-            return plan
-            
-        except Exception as e:
-            # Fallback: simple extraction without LLM
-            return self._simple_plan(user_input)
+    def _parse_plan(self, text: str) -> Dict[str, Any]:
+        """Parse the model's JSON reply into a plan dict (raises on invalid JSON)."""
+        plan_text = text.strip()
+        # Remove markdown code blocks if present
+        if plan_text.startswith("```"):
+            plan_text = plan_text.split("```")[1]
+            if plan_text.startswith("json"):
+                plan_text = plan_text[4:]
+        plan_text = plan_text.strip()
+        
+        plan = jsonio.loads(plan_text)
+        
+        # Ensure required fields
+        plan.setdefault("drug_name", "")
+        plan.setdefault("strength", None)
+        plan.setdefault("dosage_form", None)
+        plan.setdefault("tasks", [])
+        
+        return plan
 
     def _simple_plan(self, user_input: str) -> Dict[str, Any]:
         """Fallback planner that extracts basic info without LLM."""
@@ -124,17 +201,13 @@ Only return valid JSON, no additional text."""
         dosage_form = None
         
         # Try to extract strength (numbers with mg/mg/ml/etc)
-        import re
-        strength_match = re.search(r'(\d+(?:\.\d+)?)\s*(mg|mcg|g|ml|%|units?)', user_input, re.IGNORECASE)
+        strength_match = _STRENGTH_RE.search(user_input)
         if strength_match:
             strength = strength_match.group(0)
         
-        # Try to extract dosage form
-        forms = ['tablet', 'capsule', 'injection', 'cream', 'ointment', 'solution', 'suspension']
-        for form in forms:
-            if form.lower() in user_input.lower():
-                dosage_form = form
-                break
+        # Try to extract dosage form (singular or plural word)
+        words = frozenset(w[:-1] if w.endswith('s') else w for w in _WORD_RE.findall(user_input.lower()))
+        dosage_form = next((form for form in _FORMS if form in words), None)
         
         return {
             "drug_name": drug_name,
@@ -155,3 +228,8 @@ def build_plan(user_input: str, context: Dict[str, Any] | None = None) -> Dict[s
     planner = Planner()
     return planner.build_plan(user_input, context)
 
+
+async def build_plan_async(user_input: str, context: Dict[str, Any] | None = None) -> Dict[str, Any]:
+    """Convenience function to create a plan from async code."""
+    return await Planner().build_plan_async(user_input, context)
+
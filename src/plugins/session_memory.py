@@ -0,0 +1,126 @@
+"""
+Session memory callbacks for the ADK agent.
+
+Memory is prefetched before the model runs and the final answer is stored
+afterwards, so the LLM no longer spends tool round trips on recall/remember.
+These are agent-level callbacks (not a runner plugin) because `adk web`
+builds its own runner and ignores runner.py.
+"""
+
+import logging
+from typing import Any, Dict, Optional
+
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.adk.tools.base_tool import BaseTool
+from google.adk.tools.tool_context import ToolContext
+from google.genai import types
+
+from src.memory import retrieve_from_session, store_session
+from src.tools.memory_tools import recall_drug_query, remember_drug_query
+
+logger = logging.getLogger(__name__)
+
+# Invocation-scoped state keys ("temp:" is dropped when the run ends)
+_CONTEXT_KEY = "temp:session_memory_context"
+_DRUG_KEY = "temp:session_memory_drug"
+_RECALL_KEY = "temp:session_memory_recall"
+
+
+def _text(content: Optional[types.Content]) -> str:
+    if not content or not content.parts:
+        return ""
+    return "".join(p.text for p in content.parts if p.text)
+
+
+def inject_session_memory(
+    callback_context: CallbackContext, llm_request: LlmRequest
+) -> Optional[LlmResponse]:
+    """before_model_callback: add past interactions (this session, and earlier lookups of the drug) to the request."""
+    memory_context = callback_context.state.get(_CONTEXT_KEY)
+    if memory_context is None:
+        # Look up once per run; later model calls in the same run reuse it
+        user_input = _text(callback_context.user_content)
+        past = retrieve_from_session(callback_context.session.id, user_input, limit=3) if user_input else []
+        memory_context = "\n".join(
+            f"- Q: {p.get('user_input', '')} | A: {(p.get('response') or '')[:300]}" for p in past
+        )
+        callback_context.state[_CONTEXT_KEY] = memory_context
+
+    # Set by capture_drug_identity once the drug is known (any earlier session)
+    recall = callback_context.state.get(_RECALL_KEY)
+
+    sections = []
+    if memory_context:
+        sections.append("Memory - earlier in this session we answered (mention we've looked this up before):\n"
+                        + memory_context)
+    if recall:
+        sections.append(
+            f"Memory - {recall['drug']} {recall['dosage']} was looked up {recall['query_count']} time(s) before "
+            f"(last {recall['last_queried']}; mention we've looked this up before):\n"
+            f"- A: {(recall.get('last_result') or '')[:300]}"
+        )
+
+    if sections:
+        # Added as conversation content, not to the system instruction, so the
+        # instruction prefix stays identical across runs and context caching hits.
+        note = types.Content(role="user", parts=[types.Part(text="\n\n".join(sections))])
+        # Place it just before the current user message
+        idx = len(llm_request.contents)
+        for i in range(len(llm_request.contents) - 1, -1, -1):
+            c = llm_request.contents[i]
+            if c.role == "user" and c.parts and any(p.text for p in c.parts):
+                idx = i
+                break
+        llm_request.contents.insert(idx, note)
+    return None
+
+
+def capture_drug_identity(
+    tool: BaseTool, args: Dict[str, Any], tool_context: ToolContext, tool_response: Dict
+) -> Optional[Dict]:
+    """after_tool_callback: remember which drug/strength this run is about and recall past lookups of it."""
+    if tool.name == "ob_match_identity":
+        drug_name = args.get("drug_name", "")
+        strength = args.get("strength", "")
+        tool_context.state[_DRUG_KEY] = {"drug_name": drug_name, "strength": strength}
+        if drug_name:
+            try:
+                # Drug memory outlives ADK sessions, so this covers earlier conversations
+                recalled = recall_drug_query(drug_name, strength)
+            except Exception as e:
+                logger.warning(f"Could not recall drug memory: {e}")
+                recalled = {}
+            if recalled.get("found"):
+                tool_context.state[_RECALL_KEY] = recalled
+    return None
+
+
+def store_final_response(
+    callback_context: CallbackContext, llm_response: LlmResponse
+) -> Optional[LlmResponse]:
+    """after_model_callback: persist the final (text, non-tool-call) answer."""
+    content = llm_response.content
+    if llm_response.partial or not content or not content.parts:
+        return None
+    if any(p.function_call for p in content.parts):
+        return None
+
+    response = _text(content)
+    if not response:
+        return None
+
+    drug = callback_context.state.get(_DRUG_KEY) or {}
+    try:
+        store_session(
+            callback_context.session.id,
+            _text(callback_context.user_content),
+            {"plan": {"drug_name": drug.get("drug_name", "")}},
+            response,
+        )
+        if drug.get("drug_name"):
+            remember_drug_query(drug["drug_name"], drug.get("strength", ""), response)
+    except Exception as e:
+        logger.warning(f"Could not store session memory: {e}")
+    return None
@@ -3,11 +3,19 @@ Token Budget Tracker - Learns normal token usage and sets dynamic limits
 Author: Claude.ai
 """
 
+import atexit
 import logging
-import json
-from typing import Optional, Dict, List
+import os
+import queue
+import threading
+import time
+from collections import deque
+from typing import Deque, Optional, Dict, List
 from pathlib import Path
-import statistics
+
+import numpy as np
+
+from src import jsonio
 
 from google.adk.plugins import BasePlugin
 from google.adk.agents.callback_context import CallbackContext
@@ -27,57 +35,178 @@ class TokenBudgetTracker(BasePlugin):
         self, 
         history_file: str = "token_usage_history.json",
         buffer_multiplier: float = 1.5,
-        percentile_threshold: float = 95.0
+        percentile_threshold: float = 95.0,
+        max_records: int = 50_000
     ):
-        # Call parent __init__ with name parameter
-        super().__init__(name="token_budget_tracker")  # ✅ Add this line
-        
-        # Rest of your existing code...
-        self.history_file = Path(history_file)
-        self.buffer_multiplier = buffer_multiplier
-        self.percentile_threshold = percentile_threshold
-
         """
         Args:
             history_file: Where to store token usage history
             buffer_multiplier: How much buffer to add (1.5 = 150% of P95)
             percentile_threshold: Percentile for "normal" range (95 = ignore top 5%)
+            max_records: How many of the most recent records to keep (older ones drop off)
         """
-
-            # IMPORTANT: Call parent with name parameter
         super().__init__(name="token_budget_tracker")
-    
+        
         self.history_file = Path(history_file)
         self.buffer_multiplier = buffer_multiplier
         self.percentile_threshold = percentile_threshold
+        self.max_records = max_records
         
-        # Load existing history
-        self.token_history: List[Dict] = self._load_history()
+        # New records go to an append-only JSON Lines journal; the full .json
+        # is only rewritten every `compact_every` runs and at exit.
+        self.journal_file = self.history_file.with_suffix(".jsonl")
+        self.compact_every = 100
+        self._unsaved: List[Dict] = []
+        self._runs_since_compact = 0
+        # _lock guards the in-memory history shared with the writer thread;
+        # _io_lock keeps the writer and the exit flush from overlapping
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()
+
+        # Load existing history, keeping only the most recent window so memory
+        # and stats cost stay bounded in long-running servers
+        self.token_history: Deque[Dict] = deque(
+            self._load_history()[-max_records:], maxlen=max_records
+        )
+        atexit.register(self._flush)
+        
+        # Statistics only need tokens and query_type, so those are kept as
+        # parallel arrays (query types interned to small ints) alongside the
+        # dicts, which are only used for persistence. Once max_records is
+        # reached they act as a ring buffer (order doesn't matter for stats).
+        self._tokens = np.empty(min(64, max_records), dtype=np.int32)
+        self._query_type_idx = np.empty(min(64, max_records), dtype=np.int16)
+        self._count = 0
+        self._next = 0
+        self._qt_to_idx: Dict[Optional[str], int] = {}
+        self._idx_to_qt: List[Optional[str]] = []
+        
+        # Limits are cached per query type. _pending counts the records added
+        # (or evicted) for a type since its limit was computed; get_dynamic_limit,
+        # called on every model response, only recomputes once that reaches
+        # refresh_every, or a tenth of the sample for small histories.
+        self.refresh_every = 100
+        self._limit_cache: Dict[str, int] = {}
+        self._limit_sample: Dict[str, int] = {}
+        self._pending: Dict[Optional[str], int] = {}
+        for record in self.token_history:
+            self._index(record)
         
         # Current session tracking
         self.session_tokens: Dict[str, List[int]] = {}
+        
+        # Saves happen on a background writer so runs never block on file I/O;
+        # the one-slot queue coalesces requests that arrive while it's busy
+        self.coalesce_seconds = 0.5
+        self._save_queue: "queue.Queue[bool]" = queue.Queue(maxsize=1)
+        threading.Thread(target=self._writer_loop, name="token-history-writer", daemon=True).start()
     
     def _load_history(self) -> List[Dict]:
-        """Load token usage history from file"""
+        """Load token usage history from the consolidated file plus the journal"""
+        data: List[Dict] = []
         if self.history_file.exists():
             try:
-                with open(self.history_file, 'r') as f:
-                    data = json.load(f)
-                logger.info(f"📊 Loaded {len(data)} historical token records")
-                return data
+                with open(self.history_file, 'rb') as f:
+                    data = jsonio.loads(f.read())
             except Exception as e:
                 logger.warning(f"Could not load history: {e}")
-                return []
-        return []
+                data = []
+        if self.journal_file.exists():
+            try:
+                with open(self.journal_file, 'rb') as f:
+                    data.extend(jsonio.loads(line) for line in f if line.strip())
+            except Exception as e:
+                logger.warning(f"Could not load history journal: {e}")
+        if data:
+            logger.info(f"📊 Loaded {len(data)} historical token records")
+        return data
     
-    def _save_history(self):
-        """Save token usage history to file"""
+    def _writer_loop(self):
+        """Background thread: wait for a save request, let more pile up, then save once"""
+        while True:
+            self._save_queue.get()
+            time.sleep(self.coalesce_seconds)
+            self._save_history()
+    
+    def _request_save(self):
         try:
-            with open(self.history_file, 'w') as f:
-                json.dump(self.token_history, f, indent=2)
-            logger.debug(f"💾 Saved token history to {self.history_file}")
+            self._save_queue.put_nowait(True)
+        except queue.Full:
+            pass  # a save is already pending and will pick these records up
+    
+    def _save_history(self, force_compact: bool = False):
+        """Append pending records to the journal; compact every `compact_every` runs"""
+        with self._io_lock:
+            with self._lock:
+                records, self._unsaved = self._unsaved, []
+                snapshot = None
+                if force_compact or self._runs_since_compact >= self.compact_every:
+                    # the snapshot already contains `records`
+                    snapshot = list(self.token_history)
+                    self._runs_since_compact = 0
+            
+            if snapshot is not None and self._compact(snapshot):
+                return
+            if records:
+                try:
+                    with open(self.journal_file, 'ab', buffering=1 << 16) as f:
+                        f.write(b"".join(jsonio.dumpb(r) + b"\n" for r in records))
+                    logger.debug(f"💾 Appended {len(records)} token records to {self.journal_file}")
+                except Exception as e:
+                    logger.error(f"Failed to save history: {e}")
+    
+    def _compact(self, snapshot: List[Dict]) -> bool:
+        """Rewrite the consolidated history file and drop the journal"""
+        try:
+            tmp = self.history_file.with_suffix(".json.tmp")
+            with open(tmp, 'wb', buffering=1 << 17) as f:
+                f.write(jsonio.dumpb(snapshot))
+            os.replace(tmp, self.history_file)
+            self.journal_file.unlink(missing_ok=True)
+            logger.debug(f"💾 Compacted token history to {self.history_file}")
+            return True
         except Exception as e:
-            logger.error(f"Failed to save history: {e}")
+            logger.error(f"Failed to compact history: {e}")
+            return False
+    
+    def _flush(self):
+        """Persist anything outstanding at process exit"""
+        if self._unsaved or self.journal_file.exists():
+            self._save_history(force_compact=True)
+    
+    def _index(self, record: Dict):
+        """Add a record to the token arrays and mark its limits stale"""
+        if self._count == len(self._tokens) < self.max_records:
+            size = min(2 * len(self._tokens), self.max_records)
+            self._tokens = np.resize(self._tokens, size)
+            self._query_type_idx = np.resize(self._query_type_idx, size)
+        pos = self._next
+        if self._count == self.max_records:
+            # Full: overwrite the oldest record, which changes its type's limit too
+            evicted = self._idx_to_qt[self._query_type_idx[pos]]
+            self._pending[evicted] = self._pending.get(evicted, 0) + 1
+        else:
+            self._count += 1
+        query_type = record.get("query_type")
+        idx = self._qt_to_idx.get(query_type)
+        if idx is None:
+            idx = self._qt_to_idx[query_type] = len(self._idx_to_qt)
+            self._idx_to_qt.append(query_type)
+        self._tokens[pos] = record["tokens"]
+        self._query_type_idx[pos] = idx
+        self._next = (pos + 1) % self.max_records
+        self._pending["default"] = self._pending.get("default", 0) + 1
+        self._pending[query_type] = self._pending.get(query_type, 0) + 1
+    
+    def _tokens_for(self, query_type: str) -> Optional[np.ndarray]:
+        """Token counts for a query type ("default" means every record)"""
+        tokens = self._tokens[:self._count]
+        if query_type == "default":
+            return tokens
+        idx = self._qt_to_idx.get(query_type)
+        if idx is None:
+            return None
+        return tokens[self._query_type_idx[:self._count] == idx]
     
     def get_dynamic_limit(self, query_type: str = "default") -> int:
         """
@@ -93,60 +222,99 @@ class TokenBudgetTracker(BasePlugin):
             logger.warning("⚠️ No historical data, using default limit of 5000")
             return 5000
         
-        # Filter by query type if specified
-        relevant_tokens = [
-            record["tokens"] 
-            for record in self.token_history 
-            if query_type == "default" or record.get("query_type") == query_type
-        ]
+        cached = self._limit_cache.get(query_type)
+        if cached is not None:
+            pending = self._pending.get(query_type, 0)
+            if pending < min(self.refresh_every, max(1, self._limit_sample[query_type] // 10)):
+                return cached
         
-        if not relevant_tokens:
+        relevant_tokens = self._tokens_for(query_type)
+        if relevant_tokens is None or not len(relevant_tokens):
             logger.warning(f"⚠️ No data for {query_type}, using all data")
-            relevant_tokens = [r["tokens"] for r in self.token_history]
-        
-        # Calculate statistics
-        mean = statistics.mean(relevant_tokens)
-        median = statistics.median(relevant_tokens)
-        stdev = statistics.stdev(relevant_tokens) if len(relevant_tokens) > 1 else 0
+            return self.get_dynamic_limit("default")
         
-        # Calculate percentile (remove outliers)
-        sorted_tokens = sorted(relevant_tokens)
-        percentile_idx = int(len(sorted_tokens) * (self.percentile_threshold / 100))
-        p95_value = sorted_tokens[min(percentile_idx, len(sorted_tokens) - 1)]
+        # Calculate percentile (remove outliers); partition puts the value
+        # that sorting would put at percentile_idx there in O(N)
+        n = len(relevant_tokens)
+        percentile_idx = min(int(n * (self.percentile_threshold / 100)), n - 1)
+        p95_value = int(np.partition(relevant_tokens, percentile_idx)[percentile_idx])
         
         # Add buffer
         dynamic_limit = int(p95_value * self.buffer_multiplier)
+        self._limit_cache[query_type] = dynamic_limit
+        self._limit_sample[query_type] = n
+        self._pending.pop(query_type, None)
         
-        logger.info(
-            f"📊 Token Stats ({query_type}): "
-            f"Mean={mean:.0f}, Median={median:.0f}, "
-            f"P{self.percentile_threshold}={p95_value}, "
-            f"Dynamic Limit={dynamic_limit} (P{self.percentile_threshold} × {self.buffer_multiplier})"
-        )
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(
+                f"📊 Token Stats ({query_type}): "
+                f"Mean={relevant_tokens.mean():.0f}, "
+                f"Median={np.median(relevant_tokens):.0f}, "
+                f"P{self.percentile_threshold}={p95_value}, "
+                f"Dynamic Limit={dynamic_limit} (P{self.percentile_threshold} × {self.buffer_multiplier})"
+            )
         
         return dynamic_limit
     
+    def _compute_all_limits(self) -> Dict[str, int]:
+        """
+        Bring every per-type limit up to date from a single sort of the history
+        (grouped by query type, then tokens) and return the limit cache
+        """
+        if not self._count or not self._pending:
+            return self._limit_cache
+        
+        tokens = self._tokens[:self._count]
+        types = self._query_type_idx[:self._count]
+        order = np.lexsort((tokens, types))
+        sorted_tokens = tokens[order]
+        # bounds[i]:bounds[i + 1] is type index i's run in the sorted arrays
+        bounds = np.searchsorted(types[order], np.arange(len(self._qt_to_idx) + 1))
+        
+        def percentile_idx(n: int) -> int:
+            return min(int(n * (self.percentile_threshold / 100)), n - 1)
+        
+        for query_type, idx in self._qt_to_idx.items():
+            if query_type != "default" and query_type in self._pending:
+                group = sorted_tokens[bounds[idx]:bounds[idx + 1]]
+                if len(group):
+                    p95_value = int(group[percentile_idx(len(group))])
+                    self._limit_cache[query_type] = int(p95_value * self.buffer_multiplier)
+                    self._limit_sample[query_type] = len(group)
+                else:
+                    # every record of this type has dropped out of the window
+                    self._limit_cache.pop(query_type, None)
+                    self._limit_sample.pop(query_type, None)
+        if "default" in self._pending:
+            # all records: a partition (O(N)) rather than a second full sort
+            i = percentile_idx(self._count)
+            self._limit_cache["default"] = int(int(np.partition(tokens, i)[i]) * self.buffer_multiplier)
+            self._limit_sample["default"] = self._count
+        self._pending.clear()
+        return self._limit_cache
+    
     def get_statistics(self) -> Dict:
         """Get comprehensive token usage statistics"""
         if not self.token_history:
             return {"error": "No historical data"}
         
-        all_tokens = [r["tokens"] for r in self.token_history]
-        sorted_tokens = sorted(all_tokens)
+        all_tokens = self._tokens_for("default")
+        # All percentiles in one pass (linear interpolation, so p50 is the median)
+        p50, p75, p90, p95, p99 = np.percentile(all_tokens, [50, 75, 90, 95, 99]).tolist()
         
         return {
             "total_requests": len(self.token_history),
-            "mean": statistics.mean(all_tokens),
-            "median": statistics.median(all_tokens),
-            "min": min(all_tokens),
-            "max": max(all_tokens),
-            "stdev": statistics.stdev(all_tokens) if len(all_tokens) > 1 else 0,
-            "p50": sorted_tokens[len(sorted_tokens) // 2],
-            "p75": sorted_tokens[int(len(sorted_tokens) * 0.75)],
-            "p90": sorted_tokens[int(len(sorted_tokens) * 0.90)],
-            "p95": sorted_tokens[int(len(sorted_tokens) * 0.95)],
-            "p99": sorted_tokens[int(len(sorted_tokens) * 0.99)],
-            "recommended_limit": self.get_dynamic_limit()
+            "mean": float(all_tokens.mean()),
+            "median": p50,
+            "min": int(all_tokens.min()),
+            "max": int(all_tokens.max()),
+            "stdev": float(all_tokens.std(ddof=1)) if len(all_tokens) > 1 else 0,
+            "p50": p50,
+            "p75": p75,
+            "p90": p90,
+            "p95": p95,
+            "p99": p99,
+            "recommended_limit": self._compute_all_limits()["default"]
         }
     
     async def after_model_callback(
@@ -161,27 +329,31 @@ class TokenBudgetTracker(BasePlugin):
             return None
         
         tokens = llm_response.usage_metadata.total_token_count or 0
-        session_id = callback_context.invocation_context.session.id
+        ctx = callback_context.invocation_context
+        session = ctx.session
+        session_id = session.id
+        state = ctx.state
         
         # Track in current session
-        if session_id not in self.session_tokens:
-            self.session_tokens[session_id] = []
-        self.session_tokens[session_id].append(tokens)
+        self.session_tokens.setdefault(session_id, []).append(tokens)
         
         # Determine query type (you can make this smarter)
-        state = callback_context.invocation_context.state
         query_type = state.get("query_type", "default")
         
         # Add to history
+        updated_at = session.updated_at
         record = {
             "tokens": tokens,
             "query_type": query_type,
             "session_id": session_id,
-            "agent_name": callback_context.invocation_context.agent.name,
-            "timestamp": callback_context.invocation_context.session.updated_at.isoformat() if callback_context.invocation_context.session.updated_at else None
+            "agent_name": ctx.agent.name,
+            "timestamp": updated_at.isoformat() if updated_at else None
         }
         
-        self.token_history.append(record)
+        with self._lock:
+            self.token_history.append(record)
+            self._unsaved.append(record)
+        self._index(record)
         
         # Log current usage vs limit
         dynamic_limit = self.get_dynamic_limit(query_type)
@@ -193,14 +365,13 @@ class TokenBudgetTracker(BasePlugin):
         )
         
         # Store in session state for agent to see
-        if "token_tracking" not in callback_context.invocation_context.state:
-            callback_context.invocation_context.state["token_tracking"] = {
+        tracking = state.get("token_tracking")
+        if tracking is None:
+            tracking = state["token_tracking"] = {
                 "total_tokens": 0,
                 "request_count": 0,
                 "dynamic_limit": dynamic_limit
             }
-        
-        tracking = callback_context.invocation_context.state["token_tracking"]
         tracking["total_tokens"] += tokens
         tracking["request_count"] += 1
         tracking["dynamic_limit"] = dynamic_limit
@@ -208,8 +379,10 @@ class TokenBudgetTracker(BasePlugin):
         return None
     
     async def after_run_callback(self, *, invocation_context) -> None:
-        """Save history after each run"""
-        self._save_history()
+        """Queue a history save after each run (written by the background thread)"""
+        with self._lock:
+            self._runs_since_compact += 1
+        self._request_save()
         
         # Log session summary
         tracking = invocation_context.state.get("token_tracking", {})
@@ -222,16 +395,18 @@ class TokenBudgetTracker(BasePlugin):
     
     def export_limits_for_evaluation(self, output_file: str = "evaluation_limits.json"):
         """Export calculated limits for use in evaluation config"""
+        # Types without data of their own fall back to the all-data limit,
+        # and to 5000 when there is no history at all
+        all_limits = self._compute_all_limits()
+        default = all_limits.get("default", 5000)
         limits = {
-            "default": self.get_dynamic_limit("default"),
-            "simple": self.get_dynamic_limit("simple"),
-            "complex": self.get_dynamic_limit("complex"),
-            "image": self.get_dynamic_limit("image"),
-            "statistics": self.get_statistics()
+            query_type: all_limits.get(query_type, default)
+            for query_type in ("default", "simple", "complex", "image")
         }
+        limits["statistics"] = self.get_statistics()
         
-        with open(output_file, 'w') as f:
-            json.dump(limits, f, indent=2)
+        with open(output_file, 'wb') as f:
+            f.write(jsonio.dumpb(limits))
         
         logger.info(f"📄 Exported limits to {output_file}")
         return limits
\ No newline at end of file
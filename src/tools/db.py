@@ -0,0 +1,33 @@
+"""Shared read-only SQLite connections for the Orange Book and Medicare tools."""
+
+from __future__ import annotations
+
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict
+
+# One connection per (thread, database), reused across tool calls. sqlite3
+# connections cannot be shared between threads, and batch lookups run in
+# worker threads, so a single locked connection would serialize them.
+_local = threading.local()
+
+
+def connect_readonly(db_path: str) -> sqlite3.Connection:
+    """Return this thread's read-only connection to `db_path`, opening it once."""
+    cons: Dict[str, sqlite3.Connection] = _local.__dict__.setdefault("cons", {})
+    con = cons.get(db_path)
+    if con is None:
+        # mode=ro opens without write locks; the tools never write.
+        uri = Path(db_path).resolve().as_uri() + "?mode=ro"
+        # The tool modules keep their SQL in constants, so a larger statement
+        # cache keeps every one of them prepared.
+        con = cons[db_path] = sqlite3.connect(
+            uri, uri=True, isolation_level=None, cached_statements=256
+        )
+        # Memory-map the file (shared OS page cache across threads) and give
+        # each connection a 128 MB page cache.
+        con.execute("PRAGMA query_only = 1;")
+        con.execute("PRAGMA mmap_size = 1073741824;")
+        con.execute("PRAGMA cache_size = -131072;")
+    return con
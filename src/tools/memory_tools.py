@@ -3,29 +3,110 @@ Memory tools for drug query tracking
 Author: Claude.ai at Yifon request after Plugin idea not trustable due to Google ADK ignoring custom runner
 """
 
-import json
+import os
+import threading
+import time
 from pathlib import Path
 from datetime import datetime
 from typing import Dict, List, Optional
 
+from src import jsonio
+
 # Simple file-based storage
 # Use Data folder (consistent with other data files)
 _repo_root = Path(__file__).resolve().parents[2]
-MEMORY_FILE = _repo_root / "Data" / "drug_memory.json"
+# Every query is appended to a JSON Lines log; the per-drug aggregates (small,
+# one entry per drug/dosage) live in their own JSON file and are the only
+# thing rewritten on each query.
+QUERIES_FILE = _repo_root / "Data" / "drug_queries.jsonl"
+AGGREGATES_FILE = _repo_root / "Data" / "drug_aggregates.json"
+# Single-file format used before the split; migrated on first use
+_LEGACY_FILE = _repo_root / "Data" / "drug_memory.json"
+
+# Parsed aggregates kept in process; re-read only when the file's mtime
+# changes (e.g. another process wrote it). Reentrant so remember_drug_query
+# can hold it across its load-update-save.
+_memory_cache: Optional[Dict] = None
+_memory_mtime: int = 0
+_memory_lock = threading.RLock()
+_migrated = False
+
+def _migrate_legacy():
+    """Split an old drug_memory.json into the queries log and aggregates file"""
+    global _migrated
+    with _memory_lock:
+        if _migrated:
+            return
+        _migrated = True
+        if not _LEGACY_FILE.exists() or AGGREGATES_FILE.exists():
+            return
+        with open(_LEGACY_FILE, 'rb') as f:
+            legacy = jsonio.loads(f.read())
+        with open(QUERIES_FILE, 'ab', buffering=1 << 15) as f:
+            f.write(b"".join(jsonio.dumpb(q) + b"\n" for q in legacy.get("queries", [])))
+        _save_memory(legacy.get("drugs", {}))
+        _LEGACY_FILE.rename(_LEGACY_FILE.with_suffix(".json.bak"))
 
 def _load_memory() -> Dict:
-    """Load memory from file"""
-    if MEMORY_FILE.exists():
-        with open(MEMORY_FILE, 'r') as f:
-            return json.load(f)
-    return {"queries": [], "drugs": {}}
+    """Load the per-drug aggregates (cached until the file changes)"""
+    global _memory_cache, _memory_mtime
+    with _memory_lock:
+        _migrate_legacy()
+        mtime = AGGREGATES_FILE.stat().st_mtime_ns if AGGREGATES_FILE.exists() else 0
+        if _memory_cache is None or mtime != _memory_mtime:
+            if mtime:
+                with open(AGGREGATES_FILE, 'rb') as f:
+                    _memory_cache = jsonio.loads(f.read())
+            else:
+                _memory_cache = {}
+            _memory_mtime = mtime
+        return _memory_cache
+
+def _save_memory(drugs: Dict):
+    """Save the per-drug aggregates"""
+    global _memory_cache, _memory_mtime
+    with _memory_lock:
+        # Ensure Data directory exists
+        AGGREGATES_FILE.parent.mkdir(exist_ok=True)
+        # One compact write instead of json.dump's many small ones
+        with open(AGGREGATES_FILE, 'wb', buffering=1 << 17) as f:
+            f.write(jsonio.dumpb(drugs))
+        _memory_cache = drugs
+        _memory_mtime = AGGREGATES_FILE.stat().st_mtime_ns
+
+def _append_query(record: Dict):
+    """Append one query to the JSON Lines log"""
+    QUERIES_FILE.parent.mkdir(exist_ok=True)
+    with open(QUERIES_FILE, 'ab', buffering=1 << 15) as f:
+        f.write(jsonio.dumpb(record) + b"\n")
 
-def _save_memory(memory: Dict):
-    """Save memory to file"""
-    # Ensure Data directory exists
-    MEMORY_FILE.parent.mkdir(exist_ok=True)
-    with open(MEMORY_FILE, 'w', encoding='utf-8') as f:
-        json.dump(memory, f, indent=2, ensure_ascii=False)
+def _tail_queries(limit: int) -> List[Dict]:
+    """Read the last `limit` queries by scanning the log backwards from EOF"""
+    if limit <= 0 or not QUERIES_FILE.exists():
+        return []
+    with open(QUERIES_FILE, 'rb') as f:
+        pos = f.seek(0, os.SEEK_END)
+        buf = b""
+        # Stop once more than `limit` newlines are buffered: the first line
+        # may be cut off, but the last `limit` are then complete
+        while pos > 0 and buf.count(b"\n") <= limit:
+            step = min(1 << 14, pos)
+            pos -= step
+            f.seek(pos)
+            buf = f.read(step) + buf
+    return [jsonio.loads(line) for line in buf.splitlines()[-limit:] if line.strip()]
+
+def _iso(ts) -> Optional[str]:
+    """ISO string for a stored timestamp (int ns since epoch, or an older ISO string)"""
+    if ts is None or isinstance(ts, str):
+        return ts
+    return datetime.fromtimestamp(ts / 1e9).isoformat()
+
+def _with_iso(record: Dict) -> Dict:
+    """Give a logged query its readable timestamp in place of the stored ns `ts`"""
+    if "ts" in record:
+        return {"timestamp": _iso(record.pop("ts")), **record}
+    return record
 
 def remember_drug_query(drug_name: str, dosage: str, result: str) -> Dict:
     """
@@ -39,40 +120,42 @@ def remember_drug_query(drug_name: str, dosage: str, result: str) -> Dict:
     Returns:
         Confirmation of saved memory
     """
-    memory = _load_memory()
-    
-    timestamp = datetime.now().isoformat()
-    query_key = f"{drug_name.lower()}_{dosage}"
-    
-    # Add to queries list
-    memory["queries"].append({
-        "timestamp": timestamp,
-        "drug": drug_name,
-        "dosage": dosage,
-        "result": result
-    })
-    
-    # Update drug-specific memory
-    if query_key not in memory["drugs"]:
-        memory["drugs"][query_key] = {
-            "first_queried": timestamp,
-            "query_count": 0,
-            "last_result": None
+    with _memory_lock:
+        drugs = _load_memory()
+        
+        # Stored as int nanoseconds; converted to ISO only when read back
+        ts = time.time_ns()
+        query_key = f"{drug_name.lower()}_{dosage}"
+        
+        # Add to queries log
+        _append_query({
+            "ts": ts,
+            "drug": drug_name,
+            "dosage": dosage,
+            "result": result
+        })
+        
+        # Update drug-specific memory
+        if query_key not in drugs:
+            drugs[query_key] = {
+                "first_queried": ts,
+                "query_count": 0,
+                "last_result": None
+            }
+        
+        drugs[query_key].update({
+            "query_count": drugs[query_key]["query_count"] + 1,
+            "last_queried": ts,
+            "last_result": result
+        })
+        
+        _save_memory(drugs)
+        
+        return {
+            "ok": True,
+            "message": f"Remembered query for {drug_name} {dosage}",
+            "query_count": drugs[query_key]["query_count"]
         }
-    
-    memory["drugs"][query_key].update({
-        "query_count": memory["drugs"][query_key]["query_count"] + 1,
-        "last_queried": timestamp,
-        "last_result": result
-    })
-    
-    _save_memory(memory)
-    
-    return {
-        "ok": True,
-        "message": f"Remembered query for {drug_name} {dosage}",
-        "query_count": memory["drugs"][query_key]["query_count"]
-    }
 
 def recall_drug_query(drug_name: str, dosage: str) -> Dict:
     """
@@ -85,18 +168,18 @@ def recall_drug_query(drug_name: str, dosage: str) -> Dict:
     Returns:
         Previous query information if available
     """
-    memory = _load_memory()
+    drugs = _load_memory()
     query_key = f"{drug_name.lower()}_{dosage}"
     
-    if query_key in memory["drugs"]:
-        drug_info = memory["drugs"][query_key]
+    if query_key in drugs:
+        drug_info = drugs[query_key]
         return {
             "ok": True,
             "found": True,
             "drug": drug_name,
             "dosage": dosage,
             "query_count": drug_info["query_count"],
-            "last_queried": drug_info["last_queried"],
+            "last_queried": _iso(drug_info["last_queried"]),
             "last_result": drug_info["last_result"]
         }
     else:
@@ -116,8 +199,8 @@ def get_recent_queries(limit: int = 10) -> Dict:
     Returns:
         List of recent queries
     """
-    memory = _load_memory()
-    recent = memory["queries"][-limit:]
+    _migrate_legacy()
+    recent = [_with_iso(q) for q in _tail_queries(limit)]
     
     return {
         "ok": True,
@@ -1,25 +1,78 @@
 from __future__ import annotations
 
+import asyncio
 import sqlite3
+from functools import lru_cache
 from typing import Any, Dict, List, Optional
 
+from src.cache import ttl_cache
 from src.paths import medicare_db_path
+from src.tools.db import connect_readonly
+
+
+def _connect() -> sqlite3.Connection:
+    return connect_readonly(medicare_db_path())
+
+
+# Module-level SQL so each statement text is identical across calls and
+# stays in the connection's prepared-statement cache.
+_SQL_LATEST_YEAR = "SELECT MAX(year) FROM cms_partd_costs_slim;"
+# The OR is split so each branch seeks its own (name, year, cost) index; the
+# generic branch skips rows the brand branch already returned.
+_SQL_COSTS = """
+    SELECT brand_name, generic_name, manufacturer, tot_mftr, year, avg_spend_per_dose, outlier_flag
+    FROM cms_partd_costs_slim
+    WHERE brand_name_n = :q AND year = :year AND avg_spend_per_dose IS NOT NULL
+    UNION ALL
+    SELECT brand_name, generic_name, manufacturer, tot_mftr, year, avg_spend_per_dose, outlier_flag
+    FROM cms_partd_costs_slim
+    WHERE generic_name_n = :q AND year = :year AND avg_spend_per_dose IS NOT NULL
+      AND brand_name_n IS NOT :q
+    ORDER BY avg_spend_per_dose ASC
+    LIMIT :limit
+"""
+# Single OR query for databases built before the (name, year, cost) indexes:
+# without them both UNION branches fall back to the year index and the split
+# costs twice the scan
+_SQL_COSTS_OR = """
+    SELECT brand_name, generic_name, manufacturer, tot_mftr, year, avg_spend_per_dose, outlier_flag
+    FROM cms_partd_costs_slim
+    WHERE year = :year
+      AND (brand_name_n = :q OR generic_name_n = :q)
+      AND avg_spend_per_dose IS NOT NULL
+    ORDER BY avg_spend_per_dose ASC
+    LIMIT :limit
+"""
+_COST_INDEXES = ("idx_cms_partd_costs_slim_brand_n_year", "idx_cms_partd_costs_slim_generic_n_year")
 
 
 def _norm(s: Optional[str]) -> str:
     return (s or "").strip().upper()
 
 
+@ttl_cache(maxsize=1, ttl=7 * 24 * 3600)
+def _latest_year() -> Optional[int]:
+    # medicare.db only changes when rebuilt, so a week-long cache is safe
+    y = _connect().execute(_SQL_LATEST_YEAR).fetchone()[0]
+    return int(y) if y is not None else None
+
+
+@lru_cache(maxsize=None)
+def _costs_sql(db_path: str) -> str:
+    """_SQL_COSTS if medicare.db has the per-name indexes ending in avg_spend_per_dose, else _SQL_COSTS_OR."""
+    con = _connect()
+    for index in _COST_INDEXES:
+        cols = [r[2] for r in con.execute(f"PRAGMA index_info('{index}');")]
+        if cols[-1:] != ["avg_spend_per_dose"]:
+            return _SQL_COSTS_OR
+    return _SQL_COSTS
+
+
 def medicare_latest_year() -> Dict[str, Any]:
     """
     Tool: Return the latest year available in cms_partd_costs_slim.
     """
-    con = sqlite3.connect(medicare_db_path())
-    cur = con.cursor()
-    cur.execute("SELECT MAX(year) FROM cms_partd_costs_slim;")
-    y = cur.fetchone()[0]
-    con.close()
-    return {"ok": True, "latest_year": int(y) if y is not None else None}
+    return {"ok": True, "latest_year": _latest_year()}
 
 
 def medicare_lookup_costs(name: str, year: Optional[int] = None, limit: int = 50) -> Dict[str, Any]:
@@ -27,36 +80,19 @@ def medicare_lookup_costs(name: str, year: Optional[int] = None, limit: int = 50
     Tool: Lookup Medicare Part D cost-per-dose rows where:
       brand_name_n == name OR generic_name_n == name
     If year is None, uses latest year available.
+    Items are ordered by avg_spend_per_dose ascending (cheapest first).
     """
     q = _norm(name)
     if not q:
         return {"ok": False, "error": "name is empty"}
 
-    con = sqlite3.connect(medicare_db_path())
-    cur = con.cursor()
-
     if year is None:
-        cur.execute("SELECT MAX(year) FROM cms_partd_costs_slim;")
-        year = cur.fetchone()[0]
+        year = _latest_year()
 
     if year is None:
-        con.close()
         return {"ok": False, "error": "No year data found in medicare db"}
 
-    cur.execute(
-        """
-        SELECT brand_name, generic_name, manufacturer, tot_mftr, year, avg_spend_per_dose, outlier_flag
-        FROM cms_partd_costs_slim
-        WHERE year = ?
-          AND (brand_name_n = ? OR generic_name_n = ?)
-          AND avg_spend_per_dose IS NOT NULL
-        ORDER BY avg_spend_per_dose ASC
-        LIMIT ?
-        """,
-        (int(year), q, q, int(limit)),
-    )
-    rows = cur.fetchall()
-    con.close()
+    rows = _connect().execute(_costs_sql(medicare_db_path()), {"q": q, "year": int(year), "limit": int(limit)}).fetchall()
 
     items = []
     for r in rows:
@@ -72,3 +108,17 @@ def medicare_lookup_costs(name: str, year: Optional[int] = None, limit: int = 50
         })
 
     return {"ok": True, "year": int(year), "count": len(items), "items": items}
+
+
+async def batch_medicare_lookup_costs(names: List[str], year: Optional[int] = None, limit: int = 50) -> Dict[str, Any]:
+    """
+    Tool: Lookup Medicare Part D costs for several names at once.
+    Each name is looked up concurrently with medicare_lookup_costs; results are keyed by name.
+    """
+    if not names:
+        return {"ok": False, "error": "names is empty"}
+
+    results = await asyncio.gather(
+        *(asyncio.to_thread(medicare_lookup_costs, n, year, limit) for n in names)
+    )
+    return {"ok": True, "count": len(results), "results": dict(zip(names, results))}
@@ -1,16 +1,113 @@
 from __future__ import annotations
 
+import logging
+import re
 import sqlite3
+from functools import lru_cache
 from typing import Any, Dict, List, Optional
 
 from rapidfuzz import fuzz
 from src.paths import products_db_path
+from src.tools.db import connect_readonly
+
+logger = logging.getLogger(__name__)
+
+def _connect() -> sqlite3.Connection:
+    return connect_readonly(products_db_path())
 
 
 def _norm(s: Optional[str]) -> str:
     return (s or "").strip().upper()
 
 
+@lru_cache(maxsize=None)
+def _has_fts(db_path: str) -> bool:
+    """True if products.db was built with the ob_products_fts trigram index."""
+    row = _connect().execute("SELECT 1 FROM sqlite_master WHERE name = 'ob_products_fts';").fetchone()
+    if row is None:
+        # Checked once per process, on the first identity lookup
+        logger.warning(
+            "%s predates the ob_products_fts index; partial names fall back to the slower "
+            "LIKE prefix + rapidfuzz match. Rebuild it with `python build_db.py`.", db_path
+        )
+    return row is not None
+
+
+def _fts_query(q: str) -> str:
+    # any trigram of the query may match; bm25 then ranks rows sharing the
+    # most (and rarest) trigrams first, which tolerates misspellings
+    grams = dict.fromkeys(q[i : i + 3] for i in range(len(q) - 2))
+    return " OR ".join('"' + g.replace('"', '""') + '"' for g in grams)
+
+
+# ob_match_identity ranking, computed in SQL so only the top rows come back:
+# exact name 1000, query is a prefix of the name 500, otherwise 500 minus the
+# length difference; +20 when the strength matches too. Ties keep Orange Book
+# file order: the rebuilt (FTS) layout exposes it as ob_products_slim.id,
+# older single-table builds as the table's rowid.
+_PREFIX_SCORE = 500
+_MIN_PARTIAL_LEN = 4  # shorter queries only match a trade name exactly
+_FUZZY_POOL = 50  # shortlist re-ranked (by rapidfuzz, or by strength in FTS rank ties)
+_SQL_SCORED = """
+    SELECT appl_type, appl_no, product_no, trade_name, ingredient, strength, dosage_form, route, te_code,
+           trade_name_n, strength_n,
+           (CASE
+                WHEN trade_name_n = :q THEN 1000
+                WHEN substr(trade_name_n, 1, length(:q)) = :q THEN 500
+                ELSE 500 - abs(length(trade_name_n) - length(:q))
+            END)
+           + (CASE WHEN :s <> '' AND strength_n = :s THEN 20 ELSE 0 END) AS score
+    FROM ob_products_slim
+    WHERE {where}
+    ORDER BY score DESC, {order}
+    LIMIT :n
+"""
+# Formatted once so each statement text is identical across calls and stays
+# in the connection's prepared-statement cache; keyed by _has_fts()
+_SQL_EXACT = {
+    True: _SQL_SCORED.format(where="trade_name_n = :q", order="id"),
+    False: _SQL_SCORED.format(where="trade_name_n = :q", order="rowid"),
+}
+# Names starting with the query, as an index range scan (char(1114111) is
+# the highest code point, so the range covers every continuation)
+_SQL_STARTS = _SQL_SCORED.format(where="trade_name_n >= :q AND trade_name_n < :q || char(1114111)", order="id")
+# Trigram candidates in bm25 order (trade name weighted over ingredient);
+# a strength match only breaks ties between equally ranked rows
+_SQL_FTS = """
+    SELECT p.appl_type, p.appl_no, p.product_no, p.trade_name, p.ingredient, p.strength,
+           p.dosage_form, p.route, p.te_code, p.trade_name_n, p.strength_n,
+           (CASE WHEN :s <> '' AND p.strength_n = :s THEN 20 ELSE 0 END) AS score
+    FROM (
+        SELECT rowid, bm25(ob_products_fts, 2.0, 1.0) AS rank
+        FROM ob_products_fts
+        WHERE ob_products_fts MATCH :match
+        ORDER BY rank
+        LIMIT :pool
+    ) f
+    JOIN ob_products_slim p ON p.id = f.rowid
+    ORDER BY f.rank, score DESC, p.id
+    LIMIT :n
+"""
+_SQL_PREFIX = _SQL_SCORED.format(where="trade_name_n LIKE :like", order="rowid")
+_SQL_EQUIV = """
+    SELECT appl_type, appl_no, product_no, trade_name, ingredient, strength, dosage_form, route, te_code
+    FROM ob_products_slim
+    WHERE ingredient_n = ?
+      AND strength_n = ?
+      AND dosage_form_n = ?
+      AND route_n = ?
+      {te_filter}
+    LIMIT ?
+"""
+_SQL_EQUIV_ALL = _SQL_EQUIV.format(te_filter="")
+# LIKE is case-insensitive for ASCII, matching the old upper().startswith("A")
+_SQL_EQUIV_TE_A = _SQL_EQUIV.format(te_filter="AND te_code LIKE 'A%'")
+
+
+def _scored(sql: str, params: Dict[str, Any], n: int) -> List[tuple]:
+    return _connect().execute(sql, {**params, "n": n}).fetchall()
+
+
 def ob_match_identity(drug_name: str, strength: str = "", limit: int = 50) -> Dict[str, Any]:
     """
     Tool: Given a drug name (brand or generic-ish string) and optional strength,
@@ -22,54 +119,44 @@ def ob_match_identity(drug_name: str, strength: str = "", limit: int = 50) -> Di
     if not q:
         return {"ok": False, "error": "drug_name is empty"}
 
-    con = sqlite3.connect(products_db_path())
-    cur = con.cursor()
+    qs = _norm(strength)
+    n = max(limit, 1)
+    params = {"q": q, "s": qs}
 
-    # exact normalized match first
-    cur.execute(
-        """
-        SELECT appl_type, appl_no, product_no, trade_name, ingredient, strength, dosage_form, route, te_code
-        FROM ob_products_slim
-        WHERE trade_name_n = ?
-        LIMIT ?
-        """,
-        (q, 2000),
-    )
-    rows = cur.fetchall()
-
-    # prefix fallback (index friendly)
-    if not rows and len(q) >= 4:
-        like = q[:8] + "%"
-        cur.execute(
-            """
-            SELECT appl_type, appl_no, product_no, trade_name, ingredient, strength, dosage_form, route, te_code
-            FROM ob_products_slim
-            WHERE trade_name_n LIKE ?
-            LIMIT ?
-            """,
-            (like, 2000),
-        )
-        rows = cur.fetchall()
+    fts = _has_fts(products_db_path())
 
-    con.close()
+    # exact normalized match first
+    rows = _scored(_SQL_EXACT[fts], params, n)
+
+    if not rows and len(q) >= _MIN_PARTIAL_LEN:
+        if fts:
+            # names starting with the query, then a ranked trigram (misspelling
+            # tolerant) match via FTS5
+            rows = _scored(_SQL_STARTS, params, n)
+            if not rows:
+                rows = _scored(_SQL_FTS, {**params, "match": _fts_query(q), "pool": max(n, _FUZZY_POOL)}, n)
+        else:
+            # prefix fallback (index friendly) for databases built without the index
+            rows = _scored(_SQL_PREFIX, {**params, "like": q[:8] + "%"}, max(n, _FUZZY_POOL))
 
     if not rows:
         return {"ok": False, "error": "No Orange Book match found"}
 
-    qs = _norm(strength)
-
-    scored = []
-    for r in rows:
-        appl_type, appl_no, product_no, trade_name, ingredient, st, form, route, te = r
-        score = fuzz.partial_ratio(q, _norm(trade_name))
-        if qs:
-            score += 20 if _norm(st) == qs else 0
-        scored.append((score, r))
-
-    scored.sort(key=lambda x: x[0], reverse=True)
+    # Nothing shares the query as a prefix: re-rank the SQL shortlist by fuzzy similarity
+    if not fts and rows[0][-1] < _PREFIX_SCORE:
+        # rows carry the stored trade_name_n / strength_n, so no per-row _norm
+        scored = []
+        for r in rows:
+            trade_name_n, strength_n = r[9], r[10]
+            score = fuzz.partial_ratio(q, trade_name_n)
+            if qs:
+                score += 20 if strength_n == qs else 0
+            scored.append((score, r))
+        scored.sort(key=lambda x: x[0], reverse=True)
+        rows = [r for _, r in scored]
 
     def pack(row):
-        appl_type, appl_no, product_no, trade_name, ingredient, st, form, route, te = row
+        appl_type, appl_no, product_no, trade_name, ingredient, st, form, route, te = row[:9]
         return {
             "appl_type": appl_type,
             "appl_no": appl_no,
@@ -83,8 +170,8 @@ def ob_match_identity(drug_name: str, strength: str = "", limit: int = 50) -> Di
             "classification": ("brand" if appl_type == "N" else ("generic" if appl_type == "A" else "unknown")),
         }
 
-    best = pack(scored[0][1])
-    alts = [pack(r) for _, r in scored[1 : 1 + max(0, limit - 1)]]
+    best = pack(rows[0])
+    alts = [pack(r) for r in rows[1 : 1 + max(0, limit - 1)]]
 
     return {"ok": True, "best": best, "alternates": alts}
 
@@ -100,26 +187,10 @@ def ob_find_equivalents(
     """
     Tool: Find Orange Book equivalents for a canonical product description.
     """
-    con = sqlite3.connect(products_db_path())
-    cur = con.cursor()
-
-    cur.execute(
-        """
-        SELECT appl_type, appl_no, product_no, trade_name, ingredient, strength, dosage_form, route, te_code
-        FROM ob_products_slim
-        WHERE ingredient_n = ?
-          AND strength_n = ?
-          AND dosage_form_n = ?
-          AND route_n = ?
-        LIMIT ?
-        """,
+    rows = _connect().execute(
+        _SQL_EQUIV_TE_A if te_a_only else _SQL_EQUIV_ALL,
         (_norm(ingredient), _norm(strength), _norm(dosage_form), _norm(route), 5000),
-    )
-    rows = cur.fetchall()
-    con.close()
-
-    if te_a_only:
-        rows = [r for r in rows if (r[8] or "").strip().upper().startswith("A")]
+    ).fetchall()
 
     def pack(r):
         appl_type, appl_no, product_no, trade_name, ing, st, form, rt, te = r
@@ -139,28 +210,30 @@ def ob_find_equivalents(
     return {"ok": True, "count": len(rows), "items": [pack(r) for r in rows[:limit]]}
 
 
+_SALTS = frozenset({
+    "HYDROCHLORIDE", "HCL", "SODIUM", "POTASSIUM", "CALCIUM", "MAGNESIUM",
+    "PHOSPHATE", "SULFATE", "NITRATE", "ACETATE", "BESYLATE", "MESYLATE",
+    "TARTRATE", "CITRATE", "FUMARATE", "SUCCINATE", "MALEATE", "LACTATE",
+    "CHLORIDE", "BROMIDE", "IODIDE", "OXALATE",
+})
+_INGREDIENT_SEP = re.compile(r"[;/]")
+
+
 def ob_ingredient_to_generic_candidates(ingredient: str) -> Dict[str, Any]:
     """
     Tool: Return heuristic generic-name candidates from an Orange Book ingredient string.
     This is a *tool* so the LLM can decide whether/when to use it.
     """
-    salts = {
-        "HYDROCHLORIDE", "HCL", "SODIUM", "POTASSIUM", "CALCIUM", "MAGNESIUM",
-        "PHOSPHATE", "SULFATE", "NITRATE", "ACETATE", "BESYLATE", "MESYLATE",
-        "TARTRATE", "CITRATE", "FUMARATE", "SUCCINATE", "MALEATE", "LACTATE",
-        "CHLORIDE", "BROMIDE", "IODIDE", "OXALATE",
-    }
-
     ing = _norm(ingredient)
     if not ing:
         return {"ok": False, "error": "ingredient is empty"}
 
     # split multi-ingredient on ; or /
-    parts = [p.strip() for p in ing.replace("/", ";").split(";") if p.strip()]
+    parts = [p for p in (p.strip() for p in _INGREDIENT_SEP.split(ing)) if p]
 
     cleaned = []
     for p in parts:
-        words = [w for w in p.split() if w and w not in salts]
+        words = [w for w in p.split() if w not in _SALTS]
         if words:
             cleaned.append(" ".join(words))
 
@@ -169,12 +242,5 @@ def ob_ingredient_to_generic_candidates(ingredient: str) -> Dict[str, Any]:
     if len(cleaned) > 1:
         cands.append(" ".join(cleaned))
 
-    # de-dupe
-    out = []
-    seen = set()
-    for c in cands:
-        if c not in seen:
-            seen.add(c)
-            out.append(c)
-
-    return {"ok": True, "candidates": out}
+    # de-dupe, keeping first-seen order
+    return {"ok": True, "candidates": list(dict.fromkeys(cands))}